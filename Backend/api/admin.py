@@ -1,4 +1,195 @@
-from django.contrib import admin
-from .models import Candidates,Ward,Municipality,District,Province
-# Register your models here.
-admin.site.register([Candidates,Ward,Municipality,District,Province])
\ No newline at end of file
+import hashlib
+from django import forms
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from .models import Candidates,Ward,Municipality,District,Province,Election,ArchivedCandidate,ImportJob,DuplicateFlag
+
+ADMIN_CACHE_TIMEOUT = 60
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Changelist paginator for big tables: COUNT(*) is cached for a minute per query, and a
+    page first reads just its primary keys (an index-only scan) before loading full rows
+    for those keys, instead of OFFSET-ing through full rows.
+    """
+
+    @cached_property
+    def count(self):
+        key = 'admin:count:' + hashlib.md5(str(self.object_list.query).encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, ADMIN_CACHE_TIMEOUT)
+        return count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = min(bottom + self.per_page, self.count)
+        pks = list(self.object_list.values_list('pk', flat=True)[bottom:top])
+        rows = {obj.pk: obj for obj in self.object_list.filter(pk__in=pks)}
+        return self._get_page([rows[pk] for pk in pks if pk in rows], number, self)
+
+
+class CachedFacetFilter(admin.SimpleListFilter):
+    """Choice filter whose per-choice counts come from one GROUP BY, cached for a minute."""
+    field = None
+
+    def lookups(self, request, model_admin):
+        key = f'admin:facets:{model_admin.model._meta.label}:{self.field}'
+        counts = cache.get(key)
+        if counts is None:
+            counts = list(model_admin.model.objects.values_list(self.field).annotate(n=Count('pk')).order_by(self.field))
+            cache.set(key, counts, ADMIN_CACHE_TIMEOUT)
+        labels = self.labels()
+        return [(value, f'{labels.get(value, value)} ({n})') for value, n in counts]
+
+    def labels(self):
+        return {}
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field: self.value()})
+        return queryset
+
+
+class PostFilter(CachedFacetFilter):
+    title = 'post'
+    parameter_name = 'post'
+    field = 'post'
+
+
+class ElectionFilter(CachedFacetFilter):
+    title = 'election'
+    parameter_name = 'election'
+    field = 'election'
+
+    def labels(self):
+        return dict(Election.objects.values_list('id', 'name'))
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Province)
+class ProvinceAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+
+
+@admin.register(District)
+class DistrictAdmin(admin.ModelAdmin):
+    list_display = ['name', 'province']
+    list_select_related = ['province']
+    list_filter = ['province']
+    search_fields = ['name']
+    autocomplete_fields = ['province']
+
+    def get_queryset(self, request):
+        # __str__ reads the province, autocomplete results go through here too
+        return super().get_queryset(request).select_related('province')
+
+
+@admin.register(Municipality)
+class MunicipalityAdmin(LargeTableAdmin):
+    list_display = ['name', 'type', 'district']
+    list_select_related = ['district__province']
+    list_filter = ['type']
+    search_fields = ['name']
+    autocomplete_fields = ['district']
+
+
+@admin.register(Ward)
+class WardAdmin(LargeTableAdmin):
+    list_display = ['ward_no', 'municipality', 'district']
+    list_select_related = ['municipality__district']
+    search_fields = ['municipality__name__istartswith', '=ward_no']
+    autocomplete_fields = ['municipality']
+    ordering = ['municipality__name', 'ward_no']
+
+    def get_search_results(self, request, queryset, search_term):
+        # numbers are ward numbers and words municipality name prefixes; the default OR of
+        # both per word spans two tables, which no index serves, so every ward was scanned
+        for word in search_term.split():
+            if word.isdigit():
+                queryset = queryset.filter(ward_no=int(word))
+            else:
+                queryset = queryset.filter(municipality__name__istartswith=word)
+        return queryset, False
+
+    def get_queryset(self, request):
+        # the changelist skips list_select_related once the queryset already has one
+        return super().get_queryset(request).select_related('municipality__district')
+
+    @admin.display(ordering='municipality__district__name')
+    def district(self, obj):
+        return obj.municipality.district.name
+
+
+class CandidateCsvForm(forms.Form):
+    file = forms.FileField(help_text="CSV with name, gender, post, email, bio, district, municipality, ward columns")
+
+
+@admin.register(Candidates)
+class CandidatesAdmin(LargeTableAdmin):
+    list_display = ['name', 'post', 'gender', 'ward', 'election']
+    list_select_related = ['ward__municipality', 'election']
+    list_filter = [PostFilter, ElectionFilter]
+    search_fields = ['name__istartswith', '=email']
+    autocomplete_fields = ['ward', 'election']
+    change_list_template = 'admin/api/candidates/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import-csv/', self.admin_site.admin_view(self.import_csv), name='api_candidates_import_csv'),
+        ] + super().get_urls()
+
+    def import_csv(self, request):
+        # hands the file to the import job worker instead of importing inside the request
+        form = CandidateCsvForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = ImportJob.objects.create(kind='candidates', file=form.cleaned_data['file'], created_by=request.user)
+            self.message_user(request, f"Import job #{job.id} queued, run_import_jobs will process it.", messages.SUCCESS)
+            return redirect(reverse('admin:api_importjob_change', args=[job.id]))
+        context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta, title='Import candidates from CSV')
+        return render(request, 'admin/api/candidates/import_csv.html', context)
+
+
+@admin.register(Election)
+class ElectionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'date', 'is_current', 'archived']
+    search_fields = ['name']
+
+
+@admin.register(ArchivedCandidate)
+class ArchivedCandidateAdmin(LargeTableAdmin):
+    list_display = ['name', 'post', 'ward', 'election']
+    list_select_related = ['ward__municipality', 'election']
+    list_filter = ['election']
+    search_fields = ['name__istartswith']
+    raw_id_fields = ['ward']
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'processed_rows', 'total_rows', 'error_count', 'created_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['status', 'total_rows', 'processed_rows', 'error_count', 'errors', 'active_seconds',
+                       'worker', 'attempts', 'heartbeat_at', 'created_by', 'finished_at']
+
+
+@admin.register(DuplicateFlag)
+class DuplicateFlagAdmin(admin.ModelAdmin):
+    # written by api.duplicates, admins only review and delete them
+    list_display = ['candidate_id', 'duplicate_of_id', 'reason', 'score', 'election', 'created_at']
+    list_filter = ['reason', 'election']
+    search_fields = ['=candidate_id', '=duplicate_of_id']
+    readonly_fields = ['candidate_id', 'duplicate_of_id', 'election', 'reason', 'score', 'created_at']
@@ -0,0 +1,142 @@
+"""
+Read-through cache for hot read endpoints (candidate lists, ward pages).
+
+Each entry remembers when it was computed and how long that took. While fresh it is
+served as is, except that a request may volunteer to recompute it early, with a
+probability that grows as expiry nears and with the cost of the computation (XFetch).
+After expiry it is still served for a stale window while a single request refreshes
+it. On a miss one request per key computes and the others wait for its result
+instead of all running the same query, across worker processes as long as the cache is
+shared (prod's Redis, not LocMemCache). Writes bump a per-namespace generation, which
+moves every key of that namespace to fresh ones.
+"""
+import hashlib
+import math
+import random
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = 'api:rtc'
+METRICS = ['hit', 'miss', 'stale', 'early_refresh', 'coalesced', 'wait_timeout']
+
+# which synced models (see api.changes) each namespace's responses are built from
+DEPENDENCIES = {
+    'candidates': {'candidate', 'election', 'province', 'district', 'municipality', 'ward'},
+    'wards': {'province', 'district', 'municipality', 'ward'},
+}
+
+
+def count(metric):
+    key = f'{KEY_PREFIX}:metrics:{metric}'
+    # add() then incr() so concurrent first increments don't overwrite each other
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def cache_metrics():
+    values = cache.get_many([f'{KEY_PREFIX}:metrics:{metric}' for metric in METRICS])
+    counts = {metric: values.get(f'{KEY_PREFIX}:metrics:{metric}', 0) for metric in METRICS}
+    lookups = counts['hit'] + counts['early_refresh'] + counts['stale'] + counts['coalesced'] + counts['miss']
+    counts['hit_ratio'] = round((lookups - counts['miss']) / lookups, 4) if lookups else None
+    return counts
+
+
+def reset_metrics():
+    cache.delete_many([f'{KEY_PREFIX}:metrics:{metric}' for metric in METRICS])
+
+
+def generation(namespace):
+    return cache.get_or_set(f'{KEY_PREFIX}:gen:{namespace}', 1, None)
+
+
+def invalidate(model_name):
+    """
+    Called for every write to a synced model. Bumps now and again once the write commits,
+    so whatever was recomputed from the pre-commit data in between is dropped as well.
+    """
+    def bump():
+        for namespace, models in DEPENDENCIES.items():
+            if model_name in models:
+                key = f'{KEY_PREFIX}:gen:{namespace}'
+                cache.add(key, 1, None)
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.set(key, 2, None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def request_key(request):
+    params = sorted((name, value) for name in request.query_params for value in request.query_params.getlist(name))
+    return hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+
+
+def store(key, compute, ttl, stale):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    now = time.time()
+    cache.set(key, {'value': value, 'delta': delta, 'fresh_until': now + ttl}, ttl + stale)
+    return value
+
+
+def read_through(namespace, key, compute, ttl=None, stale=None):
+    """Return the cached value for key, running compute() at most once at a time per key."""
+    ttl = settings.READ_THROUGH_TTL if ttl is None else ttl
+    stale = settings.READ_THROUGH_STALE if stale is None else stale
+    key = f'{KEY_PREFIX}:{namespace}:{generation(namespace)}:{key}'
+    lock_key = f'{key}:lock'
+    lock_timeout = settings.READ_THROUGH_LOCK_TIMEOUT
+
+    entry = cache.get(key)
+    if entry is not None:
+        now = time.time()
+        if now < entry['fresh_until']:
+            early = now - entry['delta'] * settings.READ_THROUGH_BETA * math.log(1 - random.random()) >= entry['fresh_until']
+            if not early:
+                count('hit')
+                return entry['value']
+            metric = 'early_refresh'
+        else:
+            metric = 'stale'
+        # somebody already refreshing it: keep serving what we have
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, lock_timeout):
+            count('hit' if metric == 'early_refresh' else 'stale')
+            return entry['value']
+        count(metric)
+        try:
+            return store(key, compute, ttl, stale)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, lock_timeout):
+        count('miss')
+        try:
+            return store(key, compute, ttl, stale)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    # another request is computing this key, wait for its result
+    deadline = time.monotonic() + settings.READ_THROUGH_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.READ_THROUGH_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            count('coalesced')
+            return entry['value']
+        if cache.get(lock_key) is None:
+            break
+    count('wait_timeout')
+    count('miss')
+    return store(key, compute, ttl, stale)
@@ -0,0 +1,86 @@
+from .models import Candidates, Ward, Municipality, District, Province, Election, ChangeLog
+from .sharding import gather, group_ids
+from .caching import invalidate
+
+# models mirrored by offline clients, with the columns sent for inserts and updates
+SYNCED_MODELS = {
+    'province': (Province, ['id', 'name']),
+    'district': (District, ['id', 'name', 'province_id']),
+    'municipality': (Municipality, ['id', 'name', 'type', 'district_id']),
+    'ward': (Ward, ['id', 'ward_no', 'municipality_id', 'info']),
+    'election': (Election, ['id', 'name', 'date', 'is_current', 'archived']),
+    'candidate': (Candidates, ['id', 'name', 'gender', 'post', 'email', 'election_id', 'ward_id', 'bio']),
+}
+MODEL_NAMES = {model: name for name, (model, _) in SYNCED_MODELS.items()}
+
+
+def record_changes(model, ids, action):
+    """Log a write; bulk_create/update bypass signals, so callers using them log here themselves."""
+    # every write passes through here, which makes it the place to expire cached responses
+    invalidate(MODEL_NAMES[model])
+    ChangeLog.objects.bulk_create([
+        ChangeLog(model=MODEL_NAMES[model], object_id=object_id, action=action) for object_id in ids
+    ])
+
+
+def log_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record_changes(sender, [instance.pk], 'insert' if created else 'update')
+
+
+def log_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], 'delete')
+
+
+def latest_version():
+    return ChangeLog.objects.order_by('-version').values_list('version', flat=True).first() or 0
+
+
+def changes_since(since, limit=1000):
+    """
+    Changes after version `since`, at most `limit` log rows per call, compacted to one
+    entry per object: an insert followed by updates is still an insert, anything followed
+    by a delete is a delete, and an insert deleted within the same window is dropped.
+    """
+    entries = list(ChangeLog.objects.filter(version__gt=since).order_by('version')
+                   .values_list('version', 'model', 'object_id', 'action')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    compacted = {}
+    for version, model, object_id, action in entries:
+        key = (model, object_id)
+        first_action = compacted[key][1] if key in compacted else action
+        compacted[key] = (version, first_action, action)
+
+    changes = []
+    pending = {}
+    for (model, object_id), (version, first_action, last_action) in sorted(compacted.items(), key=lambda item: item[1][0]):
+        if last_action == 'delete':
+            if first_action == 'insert':
+                continue
+            action = 'delete'
+        else:
+            action = 'insert' if first_action == 'insert' else 'update'
+        change = {'model': model, 'id': object_id, 'action': action, 'version': version}
+        if action != 'delete':
+            change['data'] = None
+            pending.setdefault(model, {})[object_id] = change
+        changes.append(change)
+
+    # current state of everything that still exists, one query per model (per shard for candidates)
+    for model_name, by_id in pending.items():
+        model, fields = SYNCED_MODELS[model_name]
+        if model is Candidates:
+            rows = gather(model.objects.using(alias).filter(id__in=ids).values(*fields)
+                          for alias, ids in group_ids(list(by_id)).items())
+        else:
+            rows = model.objects.filter(id__in=list(by_id)).values(*fields)
+        for row in rows:
+            by_id[row['id']]['data'] = row
+
+    return {
+        'version': entries[-1][0] if entries else since,
+        'has_more': has_more,
+        'changes': changes,
+    }
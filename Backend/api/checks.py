@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PER_PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # throttle buckets, read-through locks (api.caching) and stored profiles all live in the
+    # default cache; one per process means a budget and a recompute per worker
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHES:
+        return [Warning(
+            f"The default cache ({backend}) is not shared between worker processes.",
+            hint="Use a shared cache such as RedisCache, see myproject/settings/prod.py.",
+            id='api.W001',
+        )]
+    return []
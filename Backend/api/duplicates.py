@@ -0,0 +1,172 @@
+"""
+Likely duplicate candidates within an election, without comparing every pair.
+
+Each candidate gets a CandidateSignature in the catalog, so it covers every shard:
+- name_key: the name's words normalized and sorted, an exact blocking key within a district
+- email_key: the address lowercased without dots or +tag in the local part, election-wide
+- minhash: MinHash of the name's character trigrams. Its NUM_BANDS bands of ROWS_PER_BAND
+  values are hashed into SignatureBand rows. Two names whose trigram sets have Jaccard
+  similarity s share a band with probability 1 - (1 - s^3)^10: 0.91 at 0.6, 0.03 at 0.2.
+
+A new candidate is only compared with the signatures sharing one of those keys, found with
+indexed lookups however big the table is, and every pair passing compare() is stored as a
+DuplicateFlag for review. Nothing is rejected, the same name in one district can be two people.
+"""
+import hashlib
+import random
+import re
+import unicodedata
+from django.conf import settings
+from django.db.models import Q
+from .models import Ward, CandidateSignature, SignatureBand, DuplicateFlag
+
+NUM_BANDS = 10
+ROWS_PER_BAND = 3
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+MERSENNE_PRIME = (1 << 61) - 1
+# fixed seed: signatures stored by one process have to match the ones computed by another
+_permutation_random = random.Random(2079)
+PERMUTATIONS = [(_permutation_random.randrange(1, MERSENNE_PRIME), _permutation_random.randrange(MERSENNE_PRIME))
+                for _ in range(NUM_PERMUTATIONS)]
+TITLES = {'dr', 'mr', 'mrs', 'ms', 'miss', 'shri', 'sri', 'smt'}
+
+
+def name_key(name):
+    # letters of any script (Devanagari vowel signs included), digits; word order doesn't matter
+    text = unicodedata.normalize('NFKC', name or '').lower()
+    words = re.sub(r'[^\w\u0900-\u097f]+', ' ', text).split()
+    return ' '.join(sorted(word for word in words if word not in TITLES))
+
+
+def email_key(email):
+    local, _, domain = (email or '').strip().lower().partition('@')
+    if not local or not domain:
+        return ''
+    return f"{local.split('+', 1)[0].replace('.', '')}@{domain}"
+
+
+def minhash(key):
+    # nothing left of names like "Dr." to compare, their signature is empty and matches no band
+    if not key:
+        return []
+    padded = f' {key} '
+    hashes = {int.from_bytes(hashlib.blake2b(padded[i:i + 3].encode(), digest_size=8).digest(), 'big')
+              for i in range(len(padded) - 2)}
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def bands(signature):
+    # the district is part of the bucket, similar names are only compared within one
+    if not signature.minhash:
+        return []
+    return [f"{signature.district_id}:{band}:" + hashlib.md5(
+                repr(signature.minhash[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).encode()).hexdigest()[:16]
+            for band in range(NUM_BANDS)]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the trigram sets behind two MinHash signatures."""
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERMUTATIONS
+
+
+def compare(signature, other):
+    """(reason, score) when two signatures look like the same person, otherwise None."""
+    if signature.email_key and signature.email_key == other.email_key:
+        return 'email', 1.0
+    if not signature.name_key or signature.district_id is None or signature.district_id != other.district_id:
+        return None
+    if signature.name_key == other.name_key:
+        return 'name', 1.0
+    score = similarity(signature.minhash, other.minhash)
+    if score >= settings.DUPLICATE_NAME_THRESHOLD:
+        return 'similar_name', round(score, 3)
+    return None
+
+
+def blocking_keys(signature, signature_bands):
+    keys = [('band', band) for band in signature_bands]
+    if signature.name_key:
+        keys.append(('name', signature.district_id, signature.name_key))
+    if signature.email_key:
+        keys.append(('email', signature.email_key))
+    return [(signature.election_id,) + key for key in keys]
+
+
+def shared_signatures(signatures, signature_bands):
+    """
+    Every stored signature sharing a band, a (district, name) or an email with one of
+    signatures. Each OR term has an index of its own, so SQLite looks the matches up
+    (MULTI-INDEX OR) instead of reading the election's signatures. The election is left
+    out of the query on purpose, an index on it would win and scan; blocking_keys()
+    carries it, so signatures of other elections are read but never compared.
+    """
+    shared = Q(candidate_id__in=SignatureBand.objects.filter(band__in={band for rows in signature_bands.values() for band in rows})
+               .values('signature_id'))
+    names = {}
+    for signature in signatures:
+        if signature.name_key and signature.district_id is not None:
+            names.setdefault(signature.district_id, set()).add(signature.name_key)
+    for district_id, keys in names.items():
+        shared |= Q(district_id=district_id, name_key__in=keys)
+    emails = {signature.email_key for signature in signatures} - {''}
+    if emails:
+        shared |= Q(email_key__in=emails)
+    return CandidateSignature.objects.filter(shared)
+
+
+def index_candidates(candidates):
+    """
+    Sign saved candidates (replacing any signature they had) and flag the ones that look
+    like an already signed candidate of their election or like each other. A handful of
+    queries per call, so imports sign a whole chunk at once. Returns the new flags.
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return []
+    ids = [candidate.pk for candidate in candidates]
+    forget_candidates(ids)
+
+    districts = dict(Ward.objects.filter(id__in={candidate.ward_id for candidate in candidates})
+                     .values_list('id', 'municipality__district_id'))
+    signatures = []
+    for candidate in candidates:
+        key = name_key(candidate.name)
+        signatures.append(CandidateSignature(
+            candidate_id=candidate.pk, election_id=candidate.election_id, district_id=districts.get(candidate.ward_id),
+            name_key=key, email_key=email_key(candidate.email), minhash=minhash(key),
+        ))
+    signature_bands = {signature.candidate_id: bands(signature) for signature in signatures}
+    existing = shared_signatures(signatures, signature_bands)
+
+    buckets = {}
+    for other in existing:
+        # bands are a function of the stored minhash, no need to read them back
+        for key in blocking_keys(other, bands(other)):
+            buckets.setdefault(key, []).append(other)
+
+    flags = []
+    for signature in signatures:
+        seen = set()
+        for key in blocking_keys(signature, signature_bands[signature.candidate_id]):
+            for other in buckets.get(key, []):
+                if other.candidate_id in seen:
+                    continue
+                seen.add(other.candidate_id)
+                match = compare(signature, other)
+                if match:
+                    flags.append(DuplicateFlag(candidate_id=signature.candidate_id, duplicate_of_id=other.candidate_id,
+                                               election_id=signature.election_id, reason=match[0], score=match[1]))
+            # later candidates of the same batch are compared with this one too
+            buckets.setdefault(key, []).append(signature)
+
+    CandidateSignature.objects.bulk_create(signatures)
+    SignatureBand.objects.bulk_create([SignatureBand(signature_id=candidate_id, band=band)
+                                       for candidate_id, rows in signature_bands.items() for band in rows])
+    DuplicateFlag.objects.bulk_create(flags, ignore_conflicts=True)
+    return flags
+
+
+def forget_candidates(ids):
+    SignatureBand.objects.filter(signature_id__in=ids)._raw_delete(SignatureBand.objects.db)
+    CandidateSignature.objects.filter(candidate_id__in=ids)._raw_delete(CandidateSignature.objects.db)
+    DuplicateFlag.objects.filter(Q(candidate_id__in=ids) | Q(duplicate_of_id__in=ids)).delete()
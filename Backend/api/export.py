@@ -0,0 +1,154 @@
+import csv
+import heapq
+import zipfile
+from xml.sax.saxutils import escape
+from .models import Candidates, Ward, Election
+from .sharding import sharding_enabled, split
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = [
+    ('name', 'name'),
+    ('gender', 'gender'),
+    ('post', 'post'),
+    ('email', 'email'),
+    ('province', 'ward__municipality__district__province__name'),
+    ('district', 'ward__municipality__district__name'),
+    ('municipality', 'ward__municipality__name'),
+    ('ward_no', 'ward__ward_no'),
+    ('election', 'election__name'),
+    ('bio', 'bio'),
+]
+
+
+def export_rows(filters):
+    """Header plus one tuple per candidate, read with a server-side chunked iterator."""
+    yield [header for header, _ in EXPORT_COLUMNS]
+    if sharding_enabled():
+        yield from sharded_export_rows(filters)
+        return
+    queryset = (Candidates.objects.filter(**filters).order_by('id')
+                .values_list(*[column for _, column in EXPORT_COLUMNS]))
+    yield from queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def sharded_export_rows(filters):
+    # shards only have the candidates table: geography and election names are joined
+    # from the catalog here, and the per-shard id-ordered streams merged into one
+    ward_filters = {key[len('ward__'):]: value for key, value in filters.items() if key.startswith('ward__')}
+    other = {key: value for key, value in filters.items() if not key.startswith('ward__')}
+    wards = {row[0]: row[1:] for row in Ward.objects.values_list(
+        'id', 'municipality__district__province__name', 'municipality__district__name', 'municipality__name', 'ward_no')}
+    elections = dict(Election.objects.values_list('id', 'name'))
+
+    columns = ['id', 'name', 'gender', 'post', 'email', 'ward_id', 'election_id', 'bio']
+    streams = [queryset.order_by('id').values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+               for _, queryset in split(Candidates.objects.filter(**other), ward_filters)]
+    for _, name, gender, post, email, ward_id, election_id, bio in heapq.merge(*streams):
+        province, district, municipality, ward_no = wards.get(ward_id, (None,) * 4)
+        yield (name, gender, post, email, province, district, municipality, ward_no, elections.get(election_id), bio)
+
+
+class Echo:
+    # csv.writer wants a file, this one hands the formatted line straight back
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class StreamBuffer:
+    """Write-only, non-seekable sink for zipfile; whatever was written is drained by the generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Candidates" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    # inline strings avoid a shared string table, which would need every value in memory
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def stream_xlsx(rows, flush_every=500):
+    """
+    Yield a single-sheet .xlsx as it is written. The sheet XML goes through a deflate
+    stream inside a zip written to a non-seekable buffer, so memory stays constant no
+    matter how many rows there are.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/workbook.xml', WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_START.encode())
+            for count, row in enumerate(rows, start=1):
+                sheet.write(('<row>' + ''.join(xlsx_cell(value) for value in row) + '</row>').encode())
+                if count % flush_every == 0:
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            sheet.write(SHEET_END.encode())
+    yield buffer.drain()
@@ -0,0 +1,230 @@
+import csv
+import io
+import json
+import os
+import re
+import socket
+import time
+from datetime import timedelta
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Candidates, Ward, Municipality, District, Province, ImportJob
+from .changes import record_changes
+from .utils import get_ward_lookup, resolve_ward, clear_ward_lookup, get_current_election_id
+from .sharding import gather, group_wards
+from .duplicates import index_candidates
+
+CHUNK_SIZE = 500
+MAX_STORED_ERRORS = 100
+# a running job whose worker has not checked in for this long is picked up by another worker
+JOB_HEARTBEAT_TIMEOUT = timedelta(minutes=5)
+# ...at most this many times in all, so a file that kills its worker isn't retried forever
+MAX_JOB_ATTEMPTS = 3
+READ_BLOCK_SIZE = 64 * 1024
+
+municipality_expression = re.compile(r"(.*?)\s+(Rural Municipality|Municipality|Sub-Metropolitan City|Metropolitan City)")
+
+
+def read_rows(file):
+    """
+    Rows of an uploaded file as dicts: a JSON list of objects or a CSV with a header line.
+    A generator reading the file a block at a time, so big uploads never sit in memory whole.
+    """
+    with file.open('rb') as f:
+        text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+        if file.name.lower().endswith('.csv'):
+            yield from csv.DictReader(text)
+        else:
+            yield from read_json_list(text)
+
+
+def read_json_list(text):
+    decoder = json.JSONDecoder()
+    buffer = text.read(READ_BLOCK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        # a single object
+        yield json.loads(buffer + text.read())
+        return
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().removeprefix(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # the item goes on in the next block
+            block = text.read(READ_BLOCK_SIZE)
+            if not block:
+                raise
+            buffer += block
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def load_geography_entry(entry):
+    """Create the province/district/municipality/wards of one nepali_dataset.json entry."""
+    match = municipality_expression.match(entry["municipality"])
+    if not match:
+        raise ValueError(f"Unrecognised municipality name: {entry['municipality']}")
+    province, _ = Province.objects.get_or_create(name=entry["state"].lower())
+    district, _ = District.objects.get_or_create(name=entry["district"].lower(), province=province)
+    municipality, _ = Municipality.objects.get_or_create(
+        name=match.group(1).lower(),
+        district=district,
+        type=match.group(2).lower()
+    )
+    existing = set(municipality.wards.values_list('ward_no', flat=True))
+    wards = Ward.objects.bulk_create([
+        Ward(ward_no=x, municipality=municipality) for x in entry["wards"] if x not in existing
+    ])
+    record_changes(Ward, [ward.pk for ward in wards], 'insert')
+
+
+def load_geography_chunk(rows):
+    errors = []
+    for index, entry in rows:
+        try:
+            with transaction.atomic():
+                load_geography_entry(entry)
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append({'row': index, 'error': str(e)})
+    # bulk_create skips the post_save signal that normally invalidates the lookup
+    clear_ward_lookup()
+    return errors
+
+
+def load_candidate_chunk(rows):
+    """Validate a chunk of candidate rows and insert the good ones with one bulk_create."""
+    errors = []
+    lookup = get_ward_lookup()
+    election_id = get_current_election_id()
+    if election_id is None:
+        return [{'row': index, 'error': 'No current election'} for index, _ in rows]
+    parsed = []
+    for index, row in rows:
+        ward_id = resolve_ward(row.get('district'), row.get('municipality'), row.get('ward', row.get('ward_no')), lookup)
+        if ward_id is None:
+            errors.append({'row': index, 'error': 'Ward not found'})
+            continue
+        candidate = Candidates(
+            name=row.get('name'), gender=row.get('gender'), post=row.get('post'),
+            email=row.get('email'), bio=row.get('bio') or None, ward_id=ward_id, election_id=election_id,
+        )
+        try:
+            candidate.clean_fields(exclude=['ward', 'election'])
+        except ValidationError as e:
+            errors.append({'row': index, 'error': e.message_dict})
+            continue
+        parsed.append((index, candidate))
+
+    # unique (election, ward, post): check the whole chunk against the table in one query
+    ward_ids = {candidate.ward_id for _, candidate in parsed}
+    existing = set(gather(
+        Candidates.objects.using(alias).filter(election_id=election_id, ward_id__in=ids).values_list('ward_id', 'post')
+        for alias, ids in group_wards(ward_ids).items()
+    ))
+    to_create = []
+    for index, candidate in parsed:
+        key = (candidate.ward_id, candidate.post)
+        if key in existing:
+            errors.append({'row': index, 'error': f'{candidate.post} already exists for this ward'})
+            continue
+        existing.add(key)
+        to_create.append(candidate)
+    Candidates.objects.bulk_create(to_create)
+    record_changes(Candidates, [candidate.pk for candidate in to_create], 'insert')
+    # likely duplicates are flagged for review, the rows are still imported
+    index_candidates(to_create)
+    return errors
+
+
+LOADERS = {
+    'geography': load_geography_chunk,
+    'candidates': load_candidate_chunk,
+}
+
+
+def claim_job():
+    """Take the oldest queued job, or a running one whose worker went away."""
+    now = timezone.now()
+    abandoned = Q(status='running', heartbeat_at__lt=now - JOB_HEARTBEAT_TIMEOUT)
+    # every worker that took these died on them
+    for job in ImportJob.objects.filter(abandoned, attempts__gte=MAX_JOB_ATTEMPTS):
+        fail_job(job, f'Abandoned by {job.attempts} workers, not retried')
+    available = Q(status='queued') | abandoned
+    token = f'{socket.gethostname()}:{os.getpid()}:{time.monotonic_ns()}'
+    for job_id in ImportJob.objects.filter(available).order_by('created_at').values_list('id', flat=True)[:5]:
+        if ImportJob.objects.filter(available, id=job_id).update(status='running', worker=token, heartbeat_at=now,
+                                                                 attempts=F('attempts') + 1):
+            return ImportJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Process job from its checkpoint to the end, one chunk per transaction.
+    The chunk's rows and the new processed_rows offset commit together, so a crash
+    never loses or repeats a chunk.
+    """
+    try:
+        return process_job(job, chunk_size, progress)
+    except (OSError, ValueError) as e:
+        return fail_job(job, f'Could not read file: {e}')
+    except Exception as e:
+        # anything else would leave it 'running' for the next worker to trip over again
+        return fail_job(job, f'{type(e).__name__}: {e}')
+
+
+def fail_job(job, message):
+    # the failed chunk's transaction rolled back, the checkpoint in the table is what counts
+    job.refresh_from_db()
+    job.status = 'failed'
+    job.error_count += 1
+    job.errors = ([{'row': None, 'error': message}] + job.errors)[:MAX_STORED_ERRORS]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error_count', 'errors', 'finished_at'])
+    return job
+
+
+def process_job(job, chunk_size, progress):
+    loader = LOADERS[job.kind]
+    # counted in a first pass over the file, which is read again from the checkpoint
+    job.total_rows = sum(1 for _ in read_rows(job.file))
+    job.save(update_fields=['total_rows'])
+
+    rows = enumerate(islice(read_rows(job.file), job.processed_rows, None), start=job.processed_rows)
+    while job.processed_rows < job.total_rows:
+        started = time.perf_counter()
+        start = job.processed_rows
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        with transaction.atomic():
+            errors = loader(chunk)
+            job.processed_rows = start + len(chunk)
+            job.error_count += len(errors)
+            job.errors = (job.errors + errors)[:MAX_STORED_ERRORS]
+            job.active_seconds += time.perf_counter() - started
+            job.heartbeat_at = timezone.now()
+            job.save(update_fields=['processed_rows', 'error_count', 'errors', 'active_seconds', 'heartbeat_at'])
+        if progress:
+            progress(job)
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def job_progress(job):
+    rate = job.processed_rows / job.active_seconds if job.active_seconds else None
+    remaining = (job.total_rows - job.processed_rows) if job.total_rows is not None else None
+    return {
+        'rows_per_second': round(rate, 1) if rate else None,
+        'eta_seconds': round(remaining / rate, 1) if rate and remaining is not None else None,
+    }
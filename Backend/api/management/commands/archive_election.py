@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.models import Candidates, ArchivedCandidate, Election
+from api.sharding import shard_aliases
+from api.changes import record_changes
+from api.duplicates import forget_candidates
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help="Move an election's candidates out of the Candidates table into ArchivedCandidate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('election_id', type=int)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            election = Election.objects.get(pk=options['election_id'])
+        except Election.DoesNotExist:
+            raise CommandError(f"Election {options['election_id']} does not exist")
+        if election.is_current:
+            raise CommandError("Refusing to archive the current election, mark another one current first")
+
+        fields = ['name', 'gender', 'post', 'email', 'bio', 'ward_id']
+        moved = 0
+        # the archive is in the catalog, the candidates may be spread over province shards
+        for alias in shard_aliases():
+            candidates = Candidates.objects.using(alias)
+            while True:
+                with transaction.atomic(), transaction.atomic(using=alias):
+                    batch = list(candidates.filter(election=election).order_by('id').values('id', *fields)[:options['batch_size']])
+                    if not batch:
+                        break
+                    ArchivedCandidate.objects.bulk_create([
+                        ArchivedCandidate(original_id=row['id'], election=election, **{field: row[field] for field in fields})
+                        for row in batch
+                    ])
+                    # what the post_delete signals would do row by row, once for the batch
+                    ids = [row['id'] for row in batch]
+                    forget_candidates(ids)
+                    record_changes(Candidates, ids, 'delete')
+                    candidates.filter(id__in=ids)._raw_delete(alias)
+                moved += len(batch)
+                self.stdout.write(f"{moved} candidates archived")
+
+        election.archived = True
+        election.save(update_fields=['archived'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {election} archived ({moved} candidates moved)"))
@@ -0,0 +1,67 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Candidates, Election, CandidateSignature, DuplicateFlag
+from api.duplicates import index_candidates
+from api.sharding import shard_aliases, gather, group_ids
+from api.utils import get_current_election_id
+
+BATCH_SIZE = 500
+
+
+def flag_report(election):
+    flags = list(DuplicateFlag.objects.filter(election=election).order_by('candidate_id', 'duplicate_of_id')
+                 .values('candidate_id', 'duplicate_of_id', 'reason', 'score'))
+    ids = {flag['candidate_id'] for flag in flags} | {flag['duplicate_of_id'] for flag in flags}
+    # names and wards from whichever shard holds each candidate
+    candidates = {row['id']: row for row in gather(
+        Candidates.objects.using(alias).filter(id__in=group).values('id', 'name', 'email', 'ward_id')
+        for alias, group in group_ids(list(ids)).items()
+    )}
+    for flag in flags:
+        flag['candidate'] = candidates.get(flag['candidate_id'])
+        flag['duplicate_of'] = candidates.get(flag['duplicate_of_id'])
+    return flags
+
+
+class Command(BaseCommand):
+    help="Sign every candidate of an election again and report the pairs that look like the same person"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', type=int, help="election id, the current election by default")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--output', type=str, help="write the JSON list of flagged pairs to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        election_id = options['election'] or get_current_election_id()
+        election = Election.objects.filter(pk=election_id).first()
+        if election is None:
+            raise CommandError(f"Election {election_id} does not exist")
+
+        started = time.perf_counter()
+        # start over, so rows written without signals (raw loads, older data) are covered too
+        CandidateSignature.objects.filter(election=election).delete()
+        DuplicateFlag.objects.filter(election=election).delete()
+        signed = 0
+        for alias in shard_aliases():
+            last_id = 0
+            while True:
+                batch = list(Candidates.objects.using(alias).filter(election=election, id__gt=last_id).order_by('id')
+                             .only('id', 'name', 'email', 'ward_id', 'election_id')[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                # each batch is checked against the batches before it through the stored signatures
+                index_candidates(batch)
+                signed += len(batch)
+                self.stderr.write(f"{signed} candidates signed")
+
+        flags = flag_report(election)
+        report = json.dumps(flags, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
+        elapsed = round(time.perf_counter() - started, 2)
+        self.stderr.write(self.style.SUCCESS(f"✅ {signed} candidates of {election} checked, {len(flags)} likely duplicate pairs ({elapsed}s)"))
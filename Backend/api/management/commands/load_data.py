@@ -1,11 +1,9 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 import json
 import os
-from django.conf import settings
-from api.models import Candidates, Ward, Municipality, District, Province
-import re
+from api.imports import load_geography_chunk, CHUNK_SIZE
 
-data_path=os.path.join(settings.BASE_DIR,'data/nepali_dataset.json')
 
 class Command(BaseCommand):
     help="load Province,District,Municipality,Ward data"
@@ -17,6 +15,9 @@ class Command(BaseCommand):
             required=True,
             help="path to the jason file containing data"
         )
+        parser.add_argument('--skip-verify',action='store_true',help="don't compare the result with the official sources")
+        parser.add_argument('--verify-output',type=str,help="where verify_geography writes its JSON diff")
+        parser.add_argument('--strict',action='store_true',help="fail when the loaded data differs from the official sources")
         
     def handle(self,*args,**options):
         file_path=options['file']
@@ -24,24 +25,17 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f"❌ File not found: {file_path}"))
             return
 
-        with open (data_path,'r',encoding='utf-8') as f:
+        with open (file_path,'r',encoding='utf-8') as f:
             data=json.load(f)
         
-        expression=r"(.*?)\s+(Rural Municipality|Municipality|Sub-Metropolitan City|Metropolitan City)"
+        rows=list(enumerate(data))
+        for start in range(0,len(rows),CHUNK_SIZE):
+            for error in load_geography_chunk(rows[start:start+CHUNK_SIZE]):
+                self.stderr.write(self.style.WARNING(f"row {error['row']}: {error['error']}"))
+            self.stdout.write(f"{min(start+CHUNK_SIZE,len(rows))}/{len(rows)} entries loaded")
         
-        for entry in data:
-          
-            province, _ = Province.objects.get_or_create(name=entry["state"].lower())
-            district, _ = District.objects.get_or_create(name=entry["district"].lower(), province=province)
-            match=re.match(expression,entry["municipality"])
-            if match:
-                municipality, _ = Municipality.objects.get_or_create(
-                    name=match.group(1).lower(),
-                    district=district,
-                    type=match.group(2).lower()
-                )
-            for x in entry["wards"]:    
-                ward,_=Ward.objects.get_or_create(ward_no=x,municipality=municipality)
-        
-        
-        self.stdout.write(self.style.SUCCESS("✅ Data successfully loaded!"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("✅ Data successfully loaded!"))
+
+        if not options['skip_verify']:
+            call_command('verify_geography',output=options['verify_output'] or os.devnull,strict=options['strict'],
+                         stdout=self.stdout,stderr=self.stderr)
@@ -0,0 +1,24 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.snapshots import restore_snapshot
+
+
+class Command(BaseCommand):
+    help="Reset the geography, election and candidate tables to a snapshot taken with snapshot_data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', default='latest', help="snapshot name, a directory under SNAPSHOT_DIR")
+
+    def handle(self, *args, **options):
+        directory = os.path.join(settings.SNAPSHOT_DIR, options['name'])
+        if not os.path.isdir(directory):
+            raise CommandError(f"No snapshot '{options['name']}' in {settings.SNAPSHOT_DIR}")
+        started = time.perf_counter()
+        try:
+            restore_snapshot(directory)
+        except ValueError as error:
+            raise CommandError(str(error))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.SUCCESS(f"✅ Restored snapshot '{options['name']}' in {elapsed_ms:.0f} ms"))
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from api.imports import claim_job, run_job, job_progress, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help="Run queued import jobs in chunks, resuming interrupted jobs from their checkpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="rows committed per checkpoint")
+        parser.add_argument('--loop', action='store_true', help="keep waiting for new jobs instead of exiting")
+        parser.add_argument('--interval', type=float, default=2.0, help="seconds to sleep between polls when idle")
+
+    def report(self, job):
+        stats = job_progress(job)
+        self.stdout.write(
+            f"job {job.id}: {job.processed_rows}/{job.total_rows} rows, {job.error_count} errors, "
+            f"{stats['rows_per_second']} rows/s, eta {stats['eta_seconds']}s"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+            if job is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            job = run_job(job, options['chunk_size'], progress=self.report)
+            self.stdout.write(self.style.SUCCESS(f"✅ Job {job.id} {job.status}"))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from api.models import Candidates, CandidateLocation
+from api.sharding import sharding_enabled, province_for_ward, shard_for_ward
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help="Move candidates stored in 'default' to their province's database after enabling CANDIDATE_SHARDS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError("CANDIDATE_SHARDS is empty, there is nothing to shard into")
+
+        # ids are kept, so references in the change feed stay valid; registering them in
+        # the directory also moves its id counter past them
+        moved = registered = 0
+        last_id = 0
+        while True:
+            batch = list(Candidates.objects.using(DEFAULT_DB_ALIAS).filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            located = set(CandidateLocation.objects.filter(id__in=[c.id for c in batch]).values_list('id', flat=True))
+            CandidateLocation.objects.bulk_create([
+                CandidateLocation(id=c.id, province_id=province_for_ward(c.ward_id)) for c in batch if c.id not in located
+            ])
+            registered += len(batch) - len(located)
+
+            by_shard = {}
+            for candidate in batch:
+                by_shard.setdefault(shard_for_ward(candidate.ward_id), []).append(candidate)
+            by_shard.pop(DEFAULT_DB_ALIAS, None)
+            for alias, candidates in by_shard.items():
+                with transaction.atomic(using=alias), transaction.atomic():
+                    Candidates.objects.using(alias).bulk_create(candidates)
+                    # a plain DELETE: the rows live on under the same ids, the change feed has nothing to report
+                    Candidates.objects.using(DEFAULT_DB_ALIAS).filter(id__in=[c.id for c in candidates])._raw_delete(DEFAULT_DB_ALIAS)
+                moved += len(candidates)
+            self.stdout.write(f"{registered} candidates registered, {moved} moved")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {moved} candidates moved to their province shards"))
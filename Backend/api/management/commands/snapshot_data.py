@@ -0,0 +1,22 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.snapshots import take_snapshot
+
+
+class Command(BaseCommand):
+    help="Copy the geography, election and candidate data (every shard included) to a snapshot for restore_data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', default='latest', help="snapshot name, a directory under SNAPSHOT_DIR")
+
+    def handle(self, *args, **options):
+        directory = os.path.join(settings.SNAPSHOT_DIR, options['name'])
+        started = time.perf_counter()
+        try:
+            aliases = take_snapshot(directory)
+        except ValueError as error:
+            raise CommandError(str(error))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.SUCCESS(f"✅ Snapshot '{options['name']}' of {', '.join(aliases)} written to {directory} in {elapsed_ms:.0f} ms"))
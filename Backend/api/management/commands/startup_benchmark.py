@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import Client, override_settings
+from django.urls import path
+
+# run in a fresh interpreter so nothing this process already imported skews the numbers
+SETUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+elapsed = time.perf_counter() - started
+from django.conf import settings
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules), 'middleware': settings.MIDDLEWARE}))
+"""
+
+
+def ping(request):
+    return HttpResponse('ok')
+
+
+# the benchmark points ROOT_URLCONF here so the view itself costs next to nothing
+urlpatterns = [path('ping/', ping)]
+
+
+def measure_setup(settings_module, runs):
+    environment = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    # prod refuses to start without these, their values don't matter for timing
+    environment.setdefault('SECRET_KEY', 'startup-benchmark')
+    environment.setdefault('ALLOWED_HOSTS', 'testserver')
+    environment.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', SETUP_SCRIPT], cwd=settings.BASE_DIR, env=environment,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"django.setup() failed with {settings_module}:\n{result.stderr}")
+        data = json.loads(result.stdout)
+        timings.append(data['seconds'])
+    return min(timings), data['modules'], data['middleware']
+
+
+def measure_request(middleware, requests):
+    with override_settings(ROOT_URLCONF=__name__, MIDDLEWARE=middleware, ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.get('/ping/')
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get('/ping/')
+        return (time.perf_counter() - started) / requests
+
+
+class Command(BaseCommand):
+    help="Measure django.setup() time and per-request middleware overhead against the budgets in settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settings-module', default='myproject.settings.prod',
+                            help="settings to time django.setup() with")
+        parser.add_argument('--runs', type=int, default=3, help="fresh interpreters to start, the fastest counts")
+        parser.add_argument('--requests', type=int, default=500, help="requests per middleware measurement")
+        parser.add_argument('--setup-budget', type=float, default=settings.STARTUP_BUDGET_SECONDS)
+        parser.add_argument('--middleware-budget', type=float, default=settings.MIDDLEWARE_BUDGET_MS,
+                            help="allowed middleware overhead per request, in milliseconds")
+
+    def handle(self, *args, **options):
+        setup_seconds, modules, middleware = measure_setup(options['settings_module'], options['runs'])
+        forbidden = sorted(name for name in settings.STARTUP_FORBIDDEN_MODULES
+                           if any(module == name or module.startswith(name + '.') for module in modules))
+
+        # the middleware of the measured settings, timed against an empty stack in this process
+        with_middleware = measure_request(middleware, options['requests'])
+        without_middleware = measure_request([], options['requests'])
+        overhead_ms = max(with_middleware - without_middleware, 0) * 1000
+
+        report = {
+            'settings': options['settings_module'],
+            'setup_seconds': round(setup_seconds, 4),
+            'modules_loaded': len(modules),
+            'forbidden_modules': forbidden,
+            'middleware': middleware,
+            'middleware_overhead_ms': round(overhead_ms, 4),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+        failures = []
+        if setup_seconds > options['setup_budget']:
+            failures.append(f"django.setup() took {setup_seconds:.3f}s, budget is {options['setup_budget']}s")
+        if overhead_ms > options['middleware_budget']:
+            failures.append(f"middleware adds {overhead_ms:.3f}ms per request, budget is {options['middleware_budget']}ms")
+        if forbidden:
+            failures.append(f"imported at startup: {', '.join(forbidden)}")
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stderr.write(self.style.SUCCESS("✅ Startup and middleware within budget"))
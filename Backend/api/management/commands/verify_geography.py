@@ -0,0 +1,160 @@
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from api.models import Municipality
+from api.utils import normalize_name, normalize_municipality, closest, DISTRICT_CODES_CSV, LOCAL_BODY_CODES_CSV
+
+TOTALS_CSV = os.path.join(settings.BASE_DIR.parent, 'total-number-of-local-bodies-and-ward-per-districts.csv')
+
+# Municipality.type as written by load_data, plus the model's own choice keys
+TYPE_COLUMNS = {
+    'metropolitan city': 'metropolitan', 'metropolitan': 'metropolitan',
+    'sub-metropolitan city': 'sub_metropolitan', 'submetropolitan': 'sub_metropolitan',
+    'municipality': 'municipality', 'urban': 'municipality',
+    'rural municipality': 'rural_municipality', 'rural': 'rural_municipality',
+}
+CATEGORIES = ['metropolitan', 'sub_metropolitan', 'municipality', 'rural_municipality']
+
+
+def database_counts():
+    """Per district and category: (local bodies, wards), from one grouped query."""
+    counts = defaultdict(lambda: {category: [0, 0] for category in CATEGORIES})
+    rows = (Municipality.objects.values_list('district__name', 'type')
+            .annotate(bodies=Count('id', distinct=True), wards=Count('wards'))
+            .order_by())
+    for district, type, bodies, wards in rows:
+        category = TYPE_COLUMNS.get(normalize_name(type), 'municipality')
+        counts[normalize_name(district)][category][0] += bodies
+        counts[normalize_name(district)][category][1] += wards
+    return counts
+
+
+def official_counts():
+    counts = {}
+    with open(TOTALS_CSV, encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if normalize_name(row[0]) == 'total':
+                continue
+            numbers = [int(value) for value in row[1:9]]
+            counts[normalize_name(row[0])] = {
+                category: numbers[i * 2:i * 2 + 2] for i, category in enumerate(CATEGORIES)
+            }
+    return counts
+
+
+def official_local_units():
+    with open(LOCAL_BODY_CODES_CSV, encoding='utf-8-sig') as f:
+        return {(normalize_name(row['District']), normalize_municipality(row['Local unit'])) for row in csv.DictReader(f)}
+
+
+def official_districts():
+    with open(DISTRICT_CODES_CSV, encoding='utf-8-sig') as f:
+        return {normalize_name(row['District']) for row in csv.DictReader(f)}
+
+
+def match_names(expected, actual):
+    """
+    Set difference first; what is left on both sides is paired up by spelling similarity,
+    since the official lists and the loaded dataset transliterate some names differently.
+    """
+    missing, extra = expected - actual, actual - expected
+    renamed = {}
+    for name in sorted(missing):
+        match = closest(name, sorted(extra))
+        if match:
+            renamed[name] = match
+            extra.discard(match)
+    return sorted(missing - set(renamed)), sorted(extra), renamed
+
+
+def build_diff():
+    db_counts = database_counts()
+    db_districts = set(db_counts)
+
+    diff = {}
+    missing, extra, renamed = match_names(official_districts(), db_districts)
+    diff['districts'] = {'missing': missing, 'extra': extra, 'renamed': renamed}
+
+    units = official_local_units()
+    db_units = set(Municipality.objects.values_list('district__name', 'name'))
+    db_units = {(normalize_name(district), normalize_municipality(name)) for district, name in db_units}
+    district_names = {**{name: name for name in db_districts}, **renamed}
+    units = {(district_names.get(district, district), name) for district, name in units}
+    missing_units, extra_units, renamed_units = [], [], []
+    by_district = defaultdict(lambda: (set(), set()))
+    for district, name in units - db_units:
+        by_district[district][0].add(name)
+    for district, name in db_units - units:
+        by_district[district][1].add(name)
+    for district, (expected, actual) in sorted(by_district.items()):
+        missing, extra, renamed = match_names(expected, actual)
+        missing_units += [[district, name] for name in missing]
+        extra_units += [[district, name] for name in extra]
+        renamed_units += [[district, old, new] for old, new in renamed.items()]
+    diff['local_units'] = {'missing': missing_units, 'extra': extra_units, 'renamed': renamed_units}
+
+    totals_districts = official_counts()
+    missing, extra, renamed = match_names(set(totals_districts), db_districts)
+    mismatches = []
+    for district, expected in sorted(totals_districts.items()):
+        actual = db_counts.get(renamed.get(district, district))
+        if actual is None:
+            continue
+        for category in CATEGORIES:
+            for index, unit in enumerate(['local_bodies', 'wards']):
+                if expected[category][index] != actual[category][index]:
+                    mismatches.append({
+                        'district': district, 'category': category, 'unit': unit,
+                        'expected': expected[category][index], 'actual': actual[category][index],
+                    })
+    diff['counts'] = {'missing_districts': missing, 'extra_districts': extra, 'mismatches': mismatches}
+    diff['totals'] = {
+        'expected_wards': sum(c[category][1] for c in totals_districts.values() for category in CATEGORIES),
+        'actual_wards': sum(c[category][1] for c in db_counts.values() for category in CATEGORIES),
+    }
+    return diff
+
+
+def has_differences(diff):
+    return bool(
+        diff['districts']['missing'] or diff['districts']['extra']
+        or diff['local_units']['missing'] or diff['local_units']['extra']
+        or diff['counts']['missing_districts'] or diff['counts']['extra_districts'] or diff['counts']['mismatches']
+    )
+
+
+class Command(BaseCommand):
+    help="Compare the loaded Province/District/Municipality/Ward data with the official CSV sources"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, help="write the JSON diff to this file instead of stdout")
+        parser.add_argument('--strict', action='store_true', help="exit with an error when anything differs")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        diff = build_diff()
+        diff['elapsed_seconds'] = round(time.perf_counter() - started, 4)
+
+        report = json.dumps(diff, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
+
+        summary = (f"districts missing/extra: {len(diff['districts']['missing'])}/{len(diff['districts']['extra'])}, "
+                   f"local units missing/extra: {len(diff['local_units']['missing'])}/{len(diff['local_units']['extra'])}, "
+                   f"count mismatches: {len(diff['counts']['mismatches'])} ({diff['elapsed_seconds']}s)")
+        if not has_differences(diff):
+            self.stderr.write(self.style.SUCCESS(f"✅ Geography matches the official sources ({diff['elapsed_seconds']}s)"))
+        elif options['strict']:
+            raise CommandError(f"Geography differs from the official sources: {summary}")
+        else:
+            self.stderr.write(self.style.WARNING(f"⚠️ {summary}"))
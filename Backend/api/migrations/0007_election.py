@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-19 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_current_election(apps, schema_editor):
+    # everything loaded so far belongs to the election the site was built for
+    Election = apps.get_model('api', 'Election')
+    Candidates = apps.get_model('api', 'Candidates')
+    election, _ = Election.objects.get_or_create(name='Current election', defaults={'is_current': True})
+    Candidates.objects.filter(election__isnull=True).update(election=election)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Election',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('is_current', models.BooleanField(default=False)),
+                ('archived', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_current', True)), fields=('is_current',), name='api_single_current_election')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=256)),
+                ('gender', models.CharField(choices=[('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')], max_length=10)),
+                ('post', models.CharField(choices=[('Chairperson', 'chairperson'), ('Vice-Chairperson', 'vice-chairperson'), ('Secratary', 'secratary'), ('Member', 'member')], max_length=50)),
+                ('email', models.EmailField(default=None, max_length=254)),
+                ('bio', models.TextField(blank=True, null=True)),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_candidates', to='api.election')),
+                ('ward', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_candidates', to='api.ward')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['election', 'ward', 'post'], name='api_archived_cand_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='candidates',
+            name='election',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='candidates', to='api.election'),
+        ),
+        migrations.RunPython(assign_current_election, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='candidates',
+            name='election',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='candidates', to='api.election'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='candidates',
+            unique_together={('election', 'ward', 'post')},
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-19 19:40
+
+import json
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def info_to_json(apps, schema_editor):
+    # free text that is already a JSON object is kept as is, anything else is kept under "text"
+    Ward = apps.get_model('api', 'Ward')
+    last_id = 0
+    while True:
+        batch = list(Ward.objects.filter(id__gt=last_id).order_by('id').only('id', 'info', 'info_json')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        changed = []
+        for ward in batch:
+            if not ward.info:
+                continue
+            try:
+                value = json.loads(ward.info)
+            except ValueError:
+                value = None
+            ward.info_json = value if isinstance(value, dict) else {'text': ward.info}
+            changed.append(ward)
+        Ward.objects.bulk_update(changed, ['info_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_election'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ward',
+            name='info_json',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(info_to_json, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='ward',
+            name='info',
+        ),
+        migrations.RenameField(
+            model_name='ward',
+            old_name='info_json',
+            new_name='info',
+        ),
+        migrations.AddField(
+            model_name='ward',
+            name='population',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Cast(django.db.models.fields.json.KeyTextTransform('population', 'info'), models.IntegerField()), output_field=models.IntegerField(null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='ward',
+            index=models.Index(fields=['population'], name='api_ward_population_idx'),
+        ),
+    ]
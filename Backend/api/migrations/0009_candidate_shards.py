@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 18:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_ward_info_json'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidates',
+            name='election',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='candidates', to='api.election'),
+        ),
+        migrations.AlterField(
+            model_name='candidates',
+            name='ward',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='api.ward'),
+        ),
+        migrations.CreateModel(
+            name='CandidateLocation',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('province', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.province')),
+            ],
+        ),
+    ]
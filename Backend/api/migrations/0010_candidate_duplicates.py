@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-19 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_candidate_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateSignature',
+            fields=[
+                ('candidate_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name_key', models.CharField(max_length=256)),
+                ('email_key', models.CharField(blank=True, max_length=254)),
+                ('minhash', models.JSONField()),
+                ('district', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.district')),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.election')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DuplicateFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('candidate_id', models.BigIntegerField()),
+                ('duplicate_of_id', models.BigIntegerField(db_index=True)),
+                ('reason', models.CharField(choices=[('email', 'Same email'), ('name', 'Same name in the district'), ('similar_name', 'Similar name in the district')], max_length=20)),
+                ('score', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.election')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.CharField(db_index=True, max_length=64)),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='api.candidatesignature')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='candidatesignature',
+            index=models.Index(fields=['district', 'name_key'], name='api_signature_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candidatesignature',
+            index=models.Index(fields=['email_key'], name='api_signature_email_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='duplicateflag',
+            unique_together={('candidate_id', 'duplicate_of_id')},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 19:14
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_importjob_attempts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedcandidate',
+            index=models.Index(django.db.models.functions.comparison.Collate('name', 'nocase'), name='api_archived_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candidates',
+            index=models.Index(django.db.models.functions.comparison.Collate('name', 'nocase'), name='api_candidates_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='candidates',
+            index=models.Index(django.db.models.functions.comparison.Collate('email', 'nocase'), name='api_candidates_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='municipality',
+            index=models.Index(django.db.models.functions.comparison.Collate('name', 'nocase'), name='api_municipality_name_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Collate
 
 # Create your models here.
 class Province(models.Model):
@@ -31,6 +33,11 @@ class Municipality(models.Model):
 
     class Meta:
         unique_together = ('name', 'district')
+        indexes = [
+            # SQLite only turns the admin's case-insensitive LIKE 'prefix%' into an index range
+            # on a NOCASE index, the unique one above is BINARY
+            models.Index(Collate('name', 'nocase'), name='api_municipality_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
@@ -39,25 +46,223 @@ class Ward(models.Model):
     
     ward_no = models.PositiveIntegerField()
     municipality = models.ForeignKey(Municipality, on_delete=models.CASCADE, related_name='wards')
-    info = models.TextField(blank=True, null=True)  # or use JSONField if you want structured info
+    info = models.JSONField(default=dict, blank=True)
+    # keys of info that get filtered and sorted on are mirrored into indexed generated columns
+    population = models.GeneratedField(
+        expression=Cast(KT('info__population'), models.IntegerField()),
+        output_field=models.IntegerField(null=True),
+        db_persist=True,
+    )
 
     class Meta:
         unique_together = ('ward_no', 'municipality')
+        indexes = [
+            models.Index(fields=['population'], name='api_ward_population_idx'),
+        ]
 
     def __str__(self):
         return f"Ward {self.ward_no} - {self.municipality.name}"
 
+class Election(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    date = models.DateField(null=True, blank=True)
+    is_current = models.BooleanField(default=False)
+    # archived elections have their candidates moved to ArchivedCandidate, see the archive_election command
+    archived = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['is_current'], condition=models.Q(is_current=True), name='api_single_current_election'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+POST_CHOICES = [('Chairperson','chairperson'),('Vice-Chairperson','vice-chairperson'),('Secratary','secratary'),('Member','member')]
+GENDER_CHOICES = [('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')]
+
+class CandidateQuerySet(models.QuerySet):
+    """Writes and id lookups that pick the province shard themselves, see api.sharding."""
+
+    def for_id(self, pk):
+        from .sharding import shard_for_id
+        return self if self._db else self.using(shard_for_id(pk))
+
+    def create(self, **kwargs):
+        if self._db:
+            return super().create(**kwargs)
+        # Model.save asks the router, which looks at the instance's ward
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, **kwargs):
+        from .sharding import sharding_enabled, allocate_ids, shard_for_ward
+        if self._db or not sharding_enabled():
+            return super().bulk_create(objs, **kwargs)
+        objs = list(objs)
+        new = [obj for obj in objs if obj.pk is None]
+        for obj, pk in zip(new, allocate_ids([obj.ward_id for obj in new])):
+            obj.pk = pk
+        by_shard = {}
+        for obj in objs:
+            by_shard.setdefault(shard_for_ward(obj.ward_id), []).append(obj)
+        for alias, group in by_shard.items():
+            self.using(alias).bulk_create(group, **kwargs)
+        return objs
+
+
 class Candidates(models.Model):
     name=models.CharField(max_length=256)
-    gender = models.CharField(max_length=10, choices=[('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')])
+    gender = models.CharField(max_length=10, choices=GENDER_CHOICES)
     post=models.CharField(max_length=50,
-                          choices=[('Chairperson','chairperson'),('Vice-Chairperson','vice-chairperson'),('Secratary','secratary'),('Member','member')]
+                          choices=POST_CHOICES
                           )
     email=models.EmailField(default=None)
-    ward=models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='candidates')
+    # no database constraints: with sharding these rows live in a different database than wards and elections
+    election=models.ForeignKey(Election, on_delete=models.PROTECT, related_name='candidates', db_constraint=False)
+    ward=models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='candidates', db_constraint=False)
     bio = models.TextField(blank=True, null=True)
+
+    objects = CandidateQuerySet.as_manager()
+
     class Meta:
-        unique_together=('post','ward')
+        # the unique index doubles as the covering index for current-cycle reads by ward
+        unique_together=('election','ward','post')
+        # admin search, see Municipality
+        indexes = [
+            models.Index(Collate('name', 'nocase'), name='api_candidates_name_idx'),
+            models.Index(Collate('email', 'nocase'), name='api_candidates_email_idx'),
+        ]
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class CandidateLocation(models.Model):
+    # directory for sharded candidates: hands out their ids and remembers which province holds each one
+    id = models.BigAutoField(primary_key=True)
+    province = models.ForeignKey(Province, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f"candidate #{self.pk} in {self.province_id}"
+
+
+class CandidateSignature(models.Model):
+    # near-duplicate index, in the catalog so it spans every shard, see api.duplicates
+    candidate_id = models.BigIntegerField(primary_key=True)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='+')
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, related_name='+')
+    name_key = models.CharField(max_length=256)
+    email_key = models.CharField(max_length=254, blank=True)
+    minhash = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['district', 'name_key'], name='api_signature_name_idx'),
+            models.Index(fields=['email_key'], name='api_signature_email_idx'),
+        ]
+
+    def __str__(self):
+        return f"signature of candidate #{self.candidate_id}"
+
+
+class SignatureBand(models.Model):
+    # one LSH bucket a signature falls into, candidates sharing one are compared
+    signature = models.ForeignKey(CandidateSignature, on_delete=models.CASCADE, related_name='bands')
+    band = models.CharField(max_length=64, db_index=True)
+
+
+class DuplicateFlag(models.Model):
+    REASON_CHOICES = [
+        ('email', 'Same email'),
+        ('name', 'Same name in the district'),
+        ('similar_name', 'Similar name in the district'),
+    ]
+
+    # candidate ids without foreign keys, the rows may be in different shards
+    candidate_id = models.BigIntegerField()
+    duplicate_of_id = models.BigIntegerField(db_index=True)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='+')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('candidate_id', 'duplicate_of_id')
+
+    def __str__(self):
+        return f"candidate #{self.candidate_id} may duplicate #{self.duplicate_of_id}"
+
+
+class ArchivedCandidate(models.Model):
+    # candidates of past elections, kept out of the Candidates table that serves current reads
+    original_id = models.BigIntegerField()
+    name = models.CharField(max_length=256)
+    gender = models.CharField(max_length=10, choices=GENDER_CHOICES)
+    post = models.CharField(max_length=50, choices=POST_CHOICES)
+    email = models.EmailField(default=None)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='archived_candidates')
+    ward = models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='archived_candidates')
+    bio = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['election', 'ward', 'post'], name='api_archived_cand_idx'),
+            models.Index(Collate('name', 'nocase'), name='api_archived_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.election})"
+
+
+class ImportJob(models.Model):
+    KIND_CHOICES = [
+        ('geography', 'Province/District/Municipality/Ward data'),
+        ('candidates', 'Candidates'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file = models.FileField(upload_to='imports/')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    # checkpoint: rows before this offset are committed, a restarted worker resumes from here
+    processed_rows = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    active_seconds = models.FloatField(default=0)
+    worker = models.CharField(max_length=64, blank=True)
+    # workers that have claimed it, see api.imports.MAX_JOB_ATTEMPTS
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey('login.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import #{self.pk} ({self.status})"
+
+
+class ChangeLog(models.Model):
+    # one row per write to a synced model; version only ever grows, clients ask for changes after the last one they saw
+    ACTION_CHOICES = [
+        ('insert', 'Insert'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    version = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"v{self.version} {self.action} {self.model}#{self.object_id}"
+
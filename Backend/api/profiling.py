@@ -0,0 +1,206 @@
+"""
+Per-request profiling that works with DEBUG off.
+
+Staff send an X-Profile: 1 header (or ?_profile=1) and the request runs under cProfile
+with every SQL statement logged without its parameters; SELECTs get their EXPLAIN QUERY
+PLAN afterwards. With PROFILING_SAMPLE_RATE = N, one in N requests of anyone outside
+PROFILING_SAMPLE_EXCLUDE is profiled the same way. Results
+go to a ring buffer in the cache holding the last PROFILING_BUFFER_SIZE profiles, which
+admins browse at /api/profiles/. Profiled responses carry an X-Profile-Id header.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+KEY_PREFIX = 'api:profiles'
+SERIALIZER_FILE = os.path.join('rest_framework', 'serializers.py')
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    # the API authenticates with JWT inside the view, so ask its authenticators up front
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(Request(request))
+        except APIException:
+            return False
+        if result is not None:
+            return result[0].is_staff
+    return False
+
+
+def profile_reason(request):
+    requested = request.META.get('HTTP_X_PROFILE') or request.GET.get(settings.PROFILING_QUERY_PARAM)
+    if requested and requested != '0' and is_staff(request):
+        return 'requested'
+    if (settings.PROFILING_SAMPLE_RATE and random.randrange(settings.PROFILING_SAMPLE_RATE) == 0
+            and not request.path.startswith(tuple(settings.PROFILING_SAMPLE_EXCLUDE))):
+        return 'sampled'
+    return None
+
+
+class QueryLog:
+    """connection.execute_wrapper() that times every statement."""
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+def explain(queries, limit):
+    """
+    Attach the query plan of each distinct SELECT, at most `limit` of them, then drop the
+    parameters: only the placeholder SQL is stored, the values can be emails or password hashes.
+    """
+    plans = {}
+    for query in queries:
+        query['plan'] = None
+        if query['many'] or not query['sql'].lstrip().upper().startswith('SELECT'):
+            continue
+        key = (query['alias'], query['sql'], repr(query['params']))
+        if key not in plans:
+            if len(plans) >= limit:
+                continue
+            connection = connections[query['alias']]
+            prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + query['sql'], query['params'])
+                    # sqlite rows are (id, parent, notused, detail), other backends one text column
+                    plans[key] = [str(row[-1]) for row in cursor.fetchall()]
+            except DatabaseError as error:
+                plans[key] = [f'EXPLAIN failed: {error}']
+        query['plan'] = plans[key]
+    for query in queries:
+        del query['params']
+
+
+def time_inside(stats, filename):
+    """Seconds spent in functions of `filename` when called from other files."""
+    total = 0
+    for (function_file, _, _), (_, _, _, _, callers) in stats.stats.items():
+        if function_file.endswith(filename):
+            for (caller_file, _, _), caller_stats in callers.items():
+                if not caller_file.endswith(filename):
+                    total += caller_stats[3]
+    return total
+
+
+def record(entry):
+    """Store a profile in the ring buffer and return its id."""
+    size = settings.PROFILING_BUFFER_SIZE
+    cache.add(f'{KEY_PREFIX}:seq', 0, None)
+    entry['id'] = cache.incr(f'{KEY_PREFIX}:seq')
+    # the slot of the profile `size` ids back, which it replaces
+    cache.set(f'{KEY_PREFIX}:slot:{entry["id"] % size}', entry, None)
+    return entry['id']
+
+
+def recent_profiles():
+    size = settings.PROFILING_BUFFER_SIZE
+    last = cache.get(f'{KEY_PREFIX}:seq', 0)
+    slots = cache.get_many([f'{KEY_PREFIX}:slot:{profile_id % size}' for profile_id in range(max(1, last - size + 1), last + 1)])
+    return sorted(slots.values(), key=lambda entry: entry['id'], reverse=True)
+
+
+def get_profile(profile_id):
+    entry = cache.get(f'{KEY_PREFIX}:slot:{profile_id % settings.PROFILING_BUFFER_SIZE}')
+    # the slot may have been reused by a newer profile
+    return entry if entry is not None and entry['id'] == profile_id else None
+
+
+def clear_profiles():
+    cache.delete_many([f'{KEY_PREFIX}:seq'] + [f'{KEY_PREFIX}:slot:{slot}' for slot in range(settings.PROFILING_BUFFER_SIZE)])
+
+
+class ProfilingMiddleware:
+    """Goes last in MIDDLEWARE so its timings cover the view and the rendering only."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = profile_reason(request)
+        if reason is None:
+            return self.get_response(request)
+
+        request._profile_marks = {}
+        query_log = QueryLog()
+        profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            finished = time.perf_counter()
+
+        marks = request._profile_marks
+        view_started = marks.get('view', started)
+        view_finished = marks.get('rendering', finished)
+        stats = pstats.Stats(profiler)
+        listing = io.StringIO()
+        pstats.Stats(profiler, stream=listing).sort_stats('cumulative').print_stats(40)
+        explain(query_log.queries, settings.PROFILING_EXPLAIN_LIMIT)
+
+        user = getattr(request, 'user', None)
+        profile_id = record({
+            'created': timezone.now().isoformat(),
+            'reason': reason,
+            'method': request.method,
+            'path': request.path,
+            'query_string': request.META.get('QUERY_STRING', ''),
+            'status': response.status_code,
+            'user': user.get_username() if user is not None and user.is_authenticated else None,
+            'timings_ms': {
+                'total': round((finished - started) * 1000, 3),
+                'view': round((view_finished - view_started) * 1000, 3),
+                'serializer': round(time_inside(stats, SERIALIZER_FILE) * 1000, 3),
+                'sql': round(sum(query['ms'] for query in query_log.queries), 3),
+                'render': round((finished - view_finished) * 1000, 3),
+            },
+            'query_count': len(query_log.queries),
+            'queries': query_log.queries,
+            'profile': listing.getvalue(),
+            # same format as cProfile's dump_stats, for pstats/snakeviz
+            'pstats': marshal.dumps(stats.stats),
+        })
+        response['X-Profile-Id'] = str(profile_id)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profile_marks'):
+            request._profile_marks['view'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this, so it marks the end of the view
+        if hasattr(request, '_profile_marks'):
+            request._profile_marks['rendering'] = time.perf_counter()
+        return response
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+class ProvinceShardRouter:
+    """
+    Sends Candidates rows to the database of their ward's province (settings.CANDIDATE_SHARDS),
+    everything else to 'default'. Does nothing while CANDIDATE_SHARDS is empty.
+    """
+
+    def shard_databases(self):
+        return set(settings.CANDIDATE_SHARDS.values()) - {DEFAULT_DB_ALIAS}
+
+    def is_candidate(self, model_or_instance):
+        return model_or_instance._meta.label == 'api.Candidates'
+
+    def route(self, model, instance=None, **hints):
+        if not settings.CANDIDATE_SHARDS:
+            return None
+        if not self.is_candidate(model):
+            # e.g. candidate.ward: related rows of a sharded candidate are in the catalog
+            return DEFAULT_DB_ALIAS if instance is not None and instance._state.db in self.shard_databases() else None
+        from api.sharding import shard_for_ward
+        if instance is None:
+            return None
+        if self.is_candidate(instance):
+            # an unsaved candidate's _state.db is just the database of whatever was assigned to it first
+            if instance._state.adding and instance.ward_id:
+                return shard_for_ward(instance.ward_id)
+            return instance._state.db
+        elif instance._meta.label == 'api.Ward' and instance.pk:
+            # ward.candidates
+            return shard_for_ward(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if settings.CANDIDATE_SHARDS and (self.is_candidate(obj1) or self.is_candidate(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self.shard_databases():
+            # shards only get the candidates table, no data migrations
+            return app_label == 'api' and model_name == 'candidates'
+        return None
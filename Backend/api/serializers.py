@@ -1,7 +1,33 @@
 from rest_framework import serializers
-from .models import Candidates,Ward,Municipality,District,Province
+from django.db import IntegrityError
+from .models import Candidates,Ward,Municipality,District,Province,ImportJob,ArchivedCandidate
+from .utils import get_current_election_id
+from .imports import job_progress
 
-class candidateSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Lets a view pass fields=/exclude= to trim the output, and tells it which model
+    columns the remaining fields read so the query can load only those.
+    """
+    def __init__(self, *args, fields=None, exclude=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or ():
+            self.fields.pop(name, None)
+
+    @property
+    def readable_field_names(self):
+        return [name for name, field in self.fields.items() if not field.write_only]
+
+    @property
+    def model_columns(self):
+        # source of a plain model field, the FK column for related fields
+        return [field.source for field in self.fields.values() if not field.write_only and field.source != '*']
+
+
+class candidateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     district=serializers.CharField(write_only=True)
     municipality=serializers.CharField(write_only=True)
     ward=serializers.IntegerField(write_only=True)
@@ -19,27 +45,70 @@ class candidateSerializer(serializers.ModelSerializer):
         del validated_data["ward"]
         del validated_data["district"]
         print(validated_data)
-        canidate_obj=Candidates.objects.create(
-            ward=ward_obj, **validated_data
-        )
+        election_id=get_current_election_id()
+        if election_id is None:
+            raise serializers.ValidationError("No current election to add candidates to")
+        try:
+            canidate_obj=Candidates.objects.create(
+                ward=ward_obj, election_id=election_id, **validated_data
+            )
+        except IntegrityError:
+            raise serializers.ValidationError({"post":f"{validated_data['post']} already exists for this ward in the current election"})
         
         return canidate_obj
    
     
-class MunicipalitySerializer(serializers.ModelSerializer):
+class archivedCandidateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model=ArchivedCandidate
+        fields=['name','gender','post','email','bio']
+
+
+class WardResolveSerializer(serializers.Serializer):
+    wards = serializers.ListField(child=serializers.DictField(), max_length=5000, allow_empty=False)
+
+
+class MunicipalitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Municipality
         fields = ['id', 'name', 'type','district']
         
         
-class DistrictSerializer(serializers.ModelSerializer):
+class DistrictSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = District
         fields = ['id', 'name', 'province']
         
 
         
-class ProvinceSerializer(serializers.ModelSerializer):
+class ProvinceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Province
-        fields = ['id', 'name']
\ No newline at end of file
+        fields = ['id', 'name']
+
+
+class WardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    info = serializers.SerializerMethodField()
+    class Meta:
+        model = Ward
+        fields = ['id', 'ward_no', 'municipality', 'population', 'info']
+
+    def get_info(self, obj):
+        # with ?info_keys= the view extracts just those keys in SQL and annotates them
+        keys = self.context.get('info_keys')
+        if keys:
+            return {key: getattr(obj, f'info_key_{key}') for key in keys}
+        return obj.info
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'kind', 'file', 'status', 'total_rows', 'processed_rows', 'error_count', 'errors',
+                  'progress', 'created_at', 'finished_at']
+        read_only_fields = ['status', 'total_rows', 'processed_rows', 'error_count', 'errors', 'created_at', 'finished_at']
+
+    def get_progress(self, obj):
+        return job_progress(obj)
+
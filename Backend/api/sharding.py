@@ -0,0 +1,152 @@
+"""
+Optional province sharding of Candidates.
+
+settings.CANDIDATE_SHARDS maps province names to database aliases; a candidate lives in
+the database of its ward's province, provinces left out stay in 'default'. Everything
+else (the geography, elections, the CandidateLocation directory) is the catalog in
+'default'. With CANDIDATE_SHARDS empty every helper here resolves to 'default'.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from .models import Ward, Province, CandidateLocation
+
+SHARD_MAP_CACHE_KEY = 'api:shard-map'
+SHARD_MAP_TIMEOUT = 60 * 60
+
+
+def sharding_enabled():
+    return bool(settings.CANDIDATE_SHARDS)
+
+
+def shard_aliases():
+    """Every database that holds some province's candidates, 'default' first."""
+    if not sharding_enabled():
+        return [DEFAULT_DB_ALIAS]
+    aliases = set(get_shard_map()['provinces'].values())
+    return sorted(aliases, key=lambda alias: (alias != DEFAULT_DB_ALIAS, alias))
+
+
+def build_shard_map():
+    configured = {' '.join(name.split()).lower(): alias for name, alias in settings.CANDIDATE_SHARDS.items()}
+    provinces = {province_id: configured.get(name, DEFAULT_DB_ALIAS)
+                 for province_id, name in Province.objects.values_list('id', 'name')}
+    wards = dict(Ward.objects.values_list('id', 'municipality__district__province_id').iterator(chunk_size=2000))
+    return {'provinces': provinces, 'wards': wards}
+
+
+def get_shard_map():
+    shard_map = cache.get(SHARD_MAP_CACHE_KEY)
+    if shard_map is None:
+        shard_map = build_shard_map()
+        cache.set(SHARD_MAP_CACHE_KEY, shard_map, SHARD_MAP_TIMEOUT)
+    return shard_map
+
+
+def clear_shard_map(*args, **kwargs):
+    cache.delete(SHARD_MAP_CACHE_KEY)
+
+
+def shard_for_province(province_id):
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    return get_shard_map()['provinces'].get(province_id, DEFAULT_DB_ALIAS)
+
+
+def province_for_ward(ward_id):
+    shard_map = get_shard_map()
+    if ward_id not in shard_map['wards']:
+        # a ward created since the map was cached
+        clear_shard_map()
+        shard_map = get_shard_map()
+    return shard_map['wards'].get(ward_id)
+
+
+def shard_for_ward(ward_id):
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    return shard_for_province(province_for_ward(ward_id))
+
+
+def shard_for_id(pk):
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    province_id = CandidateLocation.objects.filter(pk=pk).values_list('province_id', flat=True).first()
+    return shard_for_province(province_id)
+
+
+def group_ids(ids):
+    """{alias: [candidate ids]} from one directory query."""
+    if not sharding_enabled():
+        return {DEFAULT_DB_ALIAS: list(ids)} if ids else {}
+    groups = {}
+    located = dict(CandidateLocation.objects.filter(pk__in=ids).values_list('id', 'province_id'))
+    for pk in ids:
+        groups.setdefault(shard_for_province(located.get(pk)), []).append(pk)
+    return groups
+
+
+def group_wards(ward_ids):
+    groups = {}
+    for ward_id in ward_ids:
+        groups.setdefault(shard_for_ward(ward_id), []).append(ward_id)
+    return groups
+
+
+def allocate_ids(ward_ids):
+    """Reserve one globally unique candidate id per ward id, in the catalog's directory."""
+    locations = CandidateLocation.objects.bulk_create([
+        CandidateLocation(province_id=province_for_ward(ward_id)) for ward_id in ward_ids
+    ])
+    return [location.pk for location in locations]
+
+
+def split(queryset, ward_filters=None):
+    """
+    [(alias, queryset)] for the shards that can hold rows of a Candidates queryset narrowed
+    by Ward lookups (e.g. {'municipality__district__name': 'chitwan'}). The lookups are
+    resolved against the catalog: a shard whose wards all match is read whole, the others
+    get a ward_id filter. Without sharding this is the queryset with the filters applied.
+    """
+    if not sharding_enabled():
+        lookups = {f'ward__{key}': value for key, value in (ward_filters or {}).items()}
+        return [(DEFAULT_DB_ALIAS, queryset.filter(**lookups))]
+    if not ward_filters:
+        return [(alias, queryset.using(alias)) for alias in shard_aliases()]
+
+    shard_map = get_shard_map()
+    by_shard = {}
+    for ward_id, province_id in shard_map['wards'].items():
+        by_shard.setdefault(shard_map['provinces'].get(province_id, DEFAULT_DB_ALIAS), set()).add(ward_id)
+    matched = group_wards(Ward.objects.filter(**ward_filters).values_list('id', flat=True))
+    parts = []
+    for alias in shard_aliases():
+        if alias not in matched:
+            continue
+        if set(matched[alias]) == by_shard[alias]:
+            parts.append((alias, queryset.using(alias)))
+        else:
+            parts.append((alias, queryset.using(alias).filter(ward_id__in=matched[alias])))
+    return parts
+
+
+def evaluate(queryset):
+    try:
+        return list(queryset)
+    finally:
+        # worker threads get their own connections, don't leave them open
+        connections.close_all()
+
+
+def gather(querysets):
+    """
+    Evaluate querysets from different shards concurrently and concatenate the rows.
+    Runs them one after another when a shard is inside a transaction on this thread,
+    since other threads' connections would not see its uncommitted writes.
+    """
+    querysets = list(querysets)
+    if len(querysets) < 2 or any(connections[queryset.db].in_atomic_block for queryset in querysets):
+        return [row for queryset in querysets for row in queryset]
+    with ThreadPoolExecutor(max_workers=len(querysets)) as pool:
+        return [row for rows in pool.map(evaluate, querysets) for row in rows]
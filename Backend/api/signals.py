@@ -0,0 +1,71 @@
+from django.db.models import ProtectedError
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from .models import Ward, Municipality, District, Province, Election, Candidates
+from .utils import clear_ward_lookup, clear_current_election
+from .changes import SYNCED_MODELS, log_save, log_delete
+from .sharding import sharding_enabled, allocate_ids, clear_shard_map, shard_aliases, shard_for_ward
+from .duplicates import index_candidates, forget_candidates
+
+# any change to the hierarchy invalidates the cached ward lookup
+for model in (Ward, Municipality, District):
+    post_save.connect(clear_ward_lookup, sender=model, dispatch_uid=f'ward-lookup-save-{model.__name__}')
+    post_delete.connect(clear_ward_lookup, sender=model, dispatch_uid=f'ward-lookup-delete-{model.__name__}')
+
+# province -> shard placement, clear_ward_lookup already drops it for the other levels
+post_save.connect(clear_shard_map, sender=Province, dispatch_uid='shard-map-save')
+post_delete.connect(clear_shard_map, sender=Province, dispatch_uid='shard-map-delete')
+
+
+def allocate_candidate_id(sender, instance, raw=False, **kwargs):
+    # shards can't each count ids from 1, new candidates take theirs from the catalog's directory
+    if instance.pk is None and not raw and sharding_enabled():
+        instance.pk = allocate_ids([instance.ward_id])[0]
+
+
+pre_save.connect(allocate_candidate_id, sender=Candidates, dispatch_uid='candidate-allocate-id')
+
+
+def sign_candidate(sender, instance, raw=False, **kwargs):
+    # bulk_create skips this, imports sign their chunks themselves
+    if not raw:
+        index_candidates([instance])
+
+
+def forget_candidate(sender, instance, **kwargs):
+    forget_candidates([instance.pk])
+
+
+post_save.connect(sign_candidate, sender=Candidates, dispatch_uid='candidate-sign')
+post_delete.connect(forget_candidate, sender=Candidates, dispatch_uid='candidate-forget')
+
+# Candidates.ward/election have no database constraints and the delete collector only looks in
+# the database of the deleted row, so CASCADE and PROTECT into the province shards happen here.
+# Not atomic with the catalog's delete: if that fails afterwards the ward stays, without candidates.
+def delete_sharded_candidates(sender, instance, using, **kwargs):
+    if not sharding_enabled():
+        return
+    alias = shard_for_ward(instance.pk)
+    if alias != using:
+        Candidates.objects.using(alias).filter(ward_id=instance.pk).delete()
+
+
+def protect_sharded_candidates(sender, instance, using, **kwargs):
+    if not sharding_enabled():
+        return
+    for alias in shard_aliases():
+        protected = list(Candidates.objects.using(alias).filter(election_id=instance.pk)[:10]) if alias != using else []
+        if protected:
+            raise ProtectedError(f"Cannot delete {instance}, candidates in '{alias}' still belong to it", set(protected))
+
+
+# deleting a province, district or municipality sends this for each of its wards too
+pre_delete.connect(delete_sharded_candidates, sender=Ward, dispatch_uid='ward-delete-sharded-candidates')
+pre_delete.connect(protect_sharded_candidates, sender=Election, dispatch_uid='election-protect-sharded-candidates')
+
+post_save.connect(clear_current_election, sender=Election, dispatch_uid='current-election-save')
+post_delete.connect(clear_current_election, sender=Election, dispatch_uid='current-election-delete')
+
+# change feed for offline clients, see api.changes
+for name, (model, _) in SYNCED_MODELS.items():
+    post_save.connect(log_save, sender=model, dispatch_uid=f'change-log-save-{name}')
+    post_delete.connect(log_delete, sender=model, dispatch_uid=f'change-log-delete-{name}')
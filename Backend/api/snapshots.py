@@ -0,0 +1,162 @@
+"""
+Snapshots of the geography, election and candidate tables for test and staging resets.
+
+take_snapshot() copies every database involved (the catalog and any province shards) to
+<directory>/<alias>.sqlite3 with SQLite's online backup API. restore_snapshot() puts those
+tables back with a plain DELETE and INSERT ... per table, foreign key checks deferred to
+the commit and the AUTOINCREMENT counters reset. The ORM's delete collector and signals
+are skipped, which is what makes it fast, so the caches they would have expired are
+cleared at the end. Other tables (users, import jobs) are left alone, and so is the
+ChangeLog: its versions only ever grow, the restore is appended to it as the inserts,
+updates and deletes that turn the old rows into the snapshot's, so offline clients catch
+up through the change feed like after any other write.
+"""
+import os
+import sqlite3
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import SET_NULL
+from .models import (Province, District, Municipality, Ward, Election, CandidateLocation, Candidates, ArchivedCandidate,
+                     CandidateSignature, SignatureBand, DuplicateFlag)
+from .changes import SYNCED_MODELS, MODEL_NAMES, record_changes
+from .caching import invalidate
+from .utils import clear_ward_lookup, clear_current_election
+
+# parents before children; with the checks deferred the order is only for reading
+SNAPSHOT_MODELS = [Province, District, Municipality, Ward, Election, CandidateLocation, Candidates, ArchivedCandidate,
+                   CandidateSignature, SignatureBand, DuplicateFlag]
+
+
+def snapshot_aliases():
+    # every configured shard, even one no province is mapped to yet
+    return [DEFAULT_DB_ALIAS] + sorted(set(settings.CANDIDATE_SHARDS.values()) - {DEFAULT_DB_ALIAS})
+
+
+def snapshot_models(alias):
+    # a shard only has the candidates table
+    return [model for model in SNAPSHOT_MODELS if router.allow_migrate_model(alias, model)]
+
+
+def snapshot_path(directory, alias):
+    return os.path.join(directory, f'{alias}.sqlite3')
+
+
+def check_sqlite(alias):
+    if connections[alias].vendor != 'sqlite':
+        raise ValueError(f"Database '{alias}' is {connections[alias].vendor}, snapshots need SQLite")
+
+
+def applied_migrations(cursor):
+    # shards may have no django_migrations table when the router keeps it out of them
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'django_migrations'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute('SELECT app, name FROM django_migrations')
+    return set(cursor.fetchall())
+
+
+def take_snapshot(directory):
+    """Copy each database holding snapshot tables to directory, return the aliases copied."""
+    aliases = snapshot_aliases()
+    for alias in aliases:
+        check_sqlite(alias)
+        # the backup waits for open write transactions, one of our own would never finish
+        if connections[alias].in_atomic_block:
+            raise ValueError(f"Database '{alias}' is inside a transaction, snapshots need committed data")
+    os.makedirs(directory, exist_ok=True)
+    for alias in aliases:
+        connection = connections[alias]
+        connection.ensure_connection()
+        target = sqlite3.connect(snapshot_path(directory, alias))
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+    return aliases
+
+
+def restore_snapshot(directory):
+    """Replace the snapshot tables of every database with the copies in directory."""
+    aliases = snapshot_aliases()
+    for alias in aliases:
+        check_sqlite(alias)
+        if not os.path.exists(snapshot_path(directory, alias)):
+            raise ValueError(f"No snapshot of '{alias}' in {directory}")
+
+    # one transaction per database, committed together once every table is in place
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(transaction.atomic(using=alias))
+        before = synced_rows(aliases)
+        for alias in aliases:
+            restore_database(alias, snapshot_path(directory, alias))
+        log_differences(before, synced_rows(aliases))
+
+    # the ward lookups and the shard map
+    clear_ward_lookup()
+    clear_current_election()
+    for model in SNAPSHOT_MODELS:
+        if model in MODEL_NAMES:
+            invalidate(MODEL_NAMES[model])
+
+
+def synced_rows(aliases):
+    """{model: {id: row}} of the snapshot tables mirrored by offline clients, every shard included."""
+    rows = {}
+    for model in SNAPSHOT_MODELS:
+        if model not in MODEL_NAMES:
+            continue
+        fields = SYNCED_MODELS[MODEL_NAMES[model]][1]
+        rows[model] = {row[0]: row for alias in aliases if model in snapshot_models(alias)
+                       for row in model.objects.using(alias).values_list(*fields).iterator(chunk_size=2000)}
+    return rows
+
+
+def log_differences(before, after):
+    for model, old in before.items():
+        new = after[model]
+        record_changes(model, [pk for pk in old if pk not in new], 'delete')
+        record_changes(model, [pk for pk in new if pk not in old], 'insert')
+        record_changes(model, [pk for pk, row in new.items() if pk in old and old[pk] != row], 'update')
+
+
+def restore_database(alias, path):
+    models = snapshot_models(alias)
+    quote = connections[alias].ops.quote_name
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        with connections[alias].cursor() as cursor:
+            if applied_migrations(source.cursor()) != applied_migrations(cursor):
+                raise ValueError(f"The snapshot of '{alias}' was taken at a different migration state")
+            cursor.execute('PRAGMA defer_foreign_keys = ON')
+            tables = []
+            for model in models:
+                table = model._meta.db_table
+                # generated columns (Ward.population) are recomputed by SQLite
+                columns = [field.column for field in model._meta.local_concrete_fields if not field.generated]
+                column_list = ', '.join(quote(column) for column in columns)
+                rows = source.execute(f'SELECT {column_list} FROM {quote(table)}').fetchall()
+                cursor.execute(f'DELETE FROM {quote(table)}')
+                cursor.executemany(f'INSERT INTO {quote(table)} ({column_list}) VALUES ({", ".join(["%s"] * len(columns))})', rows)
+                tables.append(table)
+
+            # ids continue where they did when the snapshot was taken
+            placeholders = ', '.join(['%s'] * len(tables))
+            cursor.execute(f'DELETE FROM sqlite_sequence WHERE name IN ({placeholders})', tables)
+            sequences = source.execute(f'SELECT name, seq FROM sqlite_sequence WHERE name IN ({", ".join("?" * len(tables))})', tables).fetchall()
+            cursor.executemany('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', sequences)
+
+            # what on_delete=SET_NULL would have done for rows outside the snapshot, e.g. User.ward;
+            # anything else still pointing at a removed row fails the deferred check at commit
+            for model in models:
+                for relation in model._meta.related_objects:
+                    if relation.related_model in SNAPSHOT_MODELS or relation.on_delete is not SET_NULL:
+                        continue
+                    if router.db_for_write(relation.related_model) != alias:
+                        continue
+                    column = quote(relation.field.column)
+                    cursor.execute(f'UPDATE {quote(relation.related_model._meta.db_table)} SET {column} = NULL '
+                                   f'WHERE {column} IS NOT NULL AND {column} NOT IN (SELECT {quote(model._meta.pk.column)} FROM {quote(model._meta.db_table)})')
+    finally:
+        source.close()
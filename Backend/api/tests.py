@@ -1,3 +1,996 @@
-from django.test import TestCase
+import io
+import json
+import marshal
+import os
+import re
+import shutil
+import tempfile
+import uuid
+import threading
+import time
+import zipfile
+from types import SimpleNamespace
+from unittest import addModuleCleanup, skipUnless
+from unittest.mock import Mock, patch
+from xml.etree import ElementTree
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.models import ProtectedError
+from django.test.utils import CaptureQueriesContext
+from django.contrib import admin
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from login.models import User
+from . import caching, profiling, sharding, utils
+from .checks import check_shared_cache
+from .changes import changes_since, latest_version
+from .export import export_rows
+from .imports import run_job, claim_job, load_candidate_chunk, JOB_HEARTBEAT_TIMEOUT, MAX_JOB_ATTEMPTS
+from .duplicates import index_candidates, shared_signatures, bands
+from .throttling import TokenBucketThrottle
+from .snapshots import take_snapshot, restore_snapshot
+from .utils import resolve_wards, get_ward_lookup
+from .views import WardList
+from .models import Province, District, Municipality, Ward, Candidates, ImportJob, Election, ArchivedCandidate, DuplicateFlag, CandidateSignature, ChangeLog
 
-# Create your tests here.
+GEOGRAPHY = [
+    {'state': 'Bagmati Province', 'district': 'Chitwan', 'municipality': 'Bharatpur Metropolitan City', 'wards': [1, 2, 3]},
+    {'state': 'Bagmati Province', 'district': 'Chitwan', 'municipality': 'Ratnanagar Municipality', 'wards': [1, 2]},
+    {'state': 'Koshi Province', 'district': 'Bhojpur', 'municipality': 'Shadanand Municipality', 'wards': [1]},
+]
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='strong-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, kind, name, content):
+        response = self.client.post('/api/jobs/', {'kind': kind, 'file': SimpleUploadedFile(name, content)}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        return response.data['id']
+
+    def test_geography_job_runs_in_chunks_and_reports_progress(self):
+        job_id = self.upload('geography', 'geo.json', json.dumps(GEOGRAPHY).encode())
+        run_job(claim_job(), chunk_size=2)
+        self.assertEqual(Ward.objects.count(), 6)
+
+        data = self.client.get(f'/api/jobs/{job_id}/').data
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual((data['processed_rows'], data['total_rows'], data['error_count']), (3, 3, 0))
+        self.assertIsNotNone(data['progress']['rows_per_second'])
+        self.assertEqual(data['progress']['eta_seconds'], 0)
+
+    def test_interrupted_job_resumes_from_checkpoint(self):
+        job_id = self.upload('geography', 'geo.json', json.dumps(GEOGRAPHY).encode())
+        # as if a worker died after committing the first two rows
+        ImportJob.objects.filter(id=job_id).update(status='queued', processed_rows=2)
+        run_job(claim_job(), chunk_size=2)
+        self.assertEqual(list(Municipality.objects.values_list('name', flat=True)), ['shadanand'])
+
+    def test_file_is_read_a_block_at_a_time(self):
+        self.upload('geography', 'geo.json', json.dumps(GEOGRAPHY, indent=2).encode())
+        # every entry spans several blocks
+        with patch('api.imports.READ_BLOCK_SIZE', 16):
+            job = run_job(claim_job(), chunk_size=2)
+        self.assertEqual((job.status, job.total_rows, job.error_count), ('done', 3, 0))
+        self.assertEqual(Ward.objects.count(), 6)
+
+    def test_unexpected_error_fails_the_job(self):
+        self.upload('geography', 'geo.json', json.dumps(GEOGRAPHY).encode())
+        with patch.dict('api.imports.LOADERS', {'geography': Mock(side_effect=RuntimeError('database went away'))}):
+            job = run_job(claim_job(), chunk_size=2)
+        self.assertEqual((job.status, job.processed_rows), ('failed', 0))
+        self.assertEqual(job.errors, [{'row': None, 'error': 'RuntimeError: database went away'}])
+        self.assertIsNone(claim_job())
+
+    def test_job_abandoned_too_often_is_not_retried(self):
+        job_id = self.upload('geography', 'geo.json', json.dumps(GEOGRAPHY).encode())
+        stale = timezone.now() - JOB_HEARTBEAT_TIMEOUT * 2
+        for _ in range(MAX_JOB_ATTEMPTS):
+            self.assertEqual(claim_job().id, job_id)
+            # the worker dies without a word
+            ImportJob.objects.filter(id=job_id).update(heartbeat_at=stale)
+        self.assertIsNone(claim_job())
+        job = ImportJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.attempts), ('failed', MAX_JOB_ATTEMPTS))
+        self.assertIn('not retried', job.errors[0]['error'])
+
+    def test_candidate_job_collects_row_errors(self):
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        Ward.objects.create(ward_no=22, municipality=municipality)
+        csv = (
+            "name,gender,post,email,district,municipality,ward\n"
+            "Biraj Acharya,Male,Chairperson,biraj@example.com,Chitwan,Bharatpur,22\n"
+            "Someone Else,Male,Chairperson,else@example.com,Chitwan,Bharatpur,22\n"
+            "Nobody,Female,Member,nobody@example.com,Chitwan,Bharatpur,99\n"
+        )
+        job_id = self.upload('candidates', 'candidates.csv', csv.encode())
+        run_job(claim_job())
+        job = ImportJob.objects.get(id=job_id)
+        self.assertEqual(Candidates.objects.count(), 1)
+        self.assertEqual(job.error_count, 2)
+        self.assertEqual([error['row'] for error in job.errors], [2, 1])
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='reader', email='reader@example.com', password='strong-pass-123'))
+        self.province = Province.objects.create(name='bagmati province')
+
+    def test_changes_are_compacted_per_object(self):
+        since = self.client.get('/api/changes/').data['version']
+        district = District.objects.create(name='chitwan', province=self.province)
+        district.name = 'chitwan district'
+        district.save()
+        self.province.name = 'bagmati'
+        self.province.save()
+        gone = District.objects.create(name='makwanpur', province=self.province)
+        gone.delete()
+
+        data = self.client.get('/api/changes/', {'since': since}).data
+        changes = {(change['model'], change['id']): change for change in data['changes']}
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes[('district', district.id)]['action'], 'insert')
+        self.assertEqual(changes[('district', district.id)]['data']['name'], 'chitwan district')
+        self.assertEqual(changes[('province', self.province.id)]['action'], 'update')
+        self.assertFalse(data['has_more'])
+
+        Province.objects.get(id=self.province.id).delete()
+        data = self.client.get('/api/changes/', {'since': data['version']}).data
+        self.assertEqual({(c['model'], c['action']) for c in data['changes']}, {('province', 'delete'), ('district', 'delete')})
+
+    def test_paging_with_limit(self):
+        for name in ['a', 'b', 'c']:
+            District.objects.create(name=name, province=self.province)
+        first = self.client.get('/api/changes/', {'limit': 2}).data
+        self.assertTrue(first['has_more'])
+        rest = self.client.get('/api/changes/', {'since': first['version']}).data
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(first['changes']) + len(rest['changes']), 4)
+
+    def test_out_of_range_paging_is_rejected(self):
+        for params in [{'limit': 0}, {'limit': -1}, {'since': -1}, {'since': 'x'}]:
+            self.assertEqual(self.client.get('/api/changes/', params).status_code, 400)
+
+
+class ElectionCycleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        self.ward = Ward.objects.create(ward_no=22, municipality=municipality)
+        self.current = Election.objects.get(is_current=True)
+        self.past = Election.objects.create(name='2017 local election')
+        Candidates.objects.create(name='Old Chair', gender='Male', post='Chairperson', email='old@example.com', ward=self.ward, election=self.past)
+        Candidates.objects.create(name='New Chair', gender='Female', post='Chairperson', email='new@example.com', ward=self.ward, election=self.current)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='reader', email='reader@example.com', password='strong-pass-123'))
+
+    def names(self, **params):
+        return [candidate['name'] for candidate in self.client.get('/api/candidate/', params).data]
+
+    def test_reads_default_to_current_election(self):
+        self.assertEqual(self.names(), ['New Chair'])
+        self.assertEqual(self.names(election=self.past.id), ['Old Chair'])
+
+    def test_unknown_election_is_rejected(self):
+        self.assertEqual(self.client.get('/api/candidate/', {'election': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/candidate/', {'election': self.past.id + 100}).status_code, 404)
+
+    def test_archiving_moves_rows_out_of_candidates(self):
+        call_command('archive_election', self.past.id, stdout=io.StringIO())
+        self.assertEqual(Candidates.objects.count(), 1)
+        self.assertEqual(ArchivedCandidate.objects.count(), 1)
+        self.assertEqual(self.names(election=self.past.id), ['Old Chair'])
+        self.assertEqual(self.names(), ['New Chair'])
+        # offline clients are told the row is gone
+        self.assertEqual(ChangeLog.objects.filter(model='candidate', action='delete').count(), 1)
+
+    def test_archiving_costs_the_same_queries_per_batch_whatever_its_size(self):
+        def archive(size):
+            election = Election.objects.create(name=f'{size} candidates')
+            for ward_no in range(size):
+                Candidates.objects.create(name=f'Member {ward_no}', gender='Male', post='Member', email=f'm{ward_no}@example.com',
+                                          ward=Ward.objects.create(ward_no=100 + ward_no + size * 100, municipality=self.ward.municipality),
+                                          election=election)
+            with CaptureQueriesContext(connection) as queries:
+                call_command('archive_election', election.id, stdout=io.StringIO())
+            self.assertEqual(ArchivedCandidate.objects.filter(election=election).count(), size)
+            return len(queries)
+
+        self.assertEqual(archive(2), archive(20))
+        self.assertFalse(CandidateSignature.objects.filter(election__name='20 candidates').exists())
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        election = Election.objects.get(is_current=True)
+        for ward_no in range(1, 61):
+            ward = Ward.objects.create(ward_no=ward_no, municipality=municipality)
+            Candidates.objects.create(name=f'Chair {ward_no}', gender='Male', post='Chairperson', email=f'c{ward_no}@example.com', ward=ward, election=election)
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='strong-pass-123')
+        self.client.force_login(admin_user)
+
+    def count_queries(self, url):
+        self.client.get(url)  # warm the cached counts
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        urls = ['/admin/api/candidates/', '/admin/api/ward/', '/admin/api/district/', '/admin/api/candidates/?p=2']
+        before = [self.count_queries(url) for url in urls]
+        municipality = Municipality.objects.get()
+        election = Election.objects.get(is_current=True)
+        for ward_no in range(61, 161):
+            ward = Ward.objects.create(ward_no=ward_no, municipality=municipality)
+            Candidates.objects.create(name=f'Chair {ward_no}', gender='Male', post='Chairperson', email=f'c{ward_no}@example.com', ward=ward, election=election)
+        cache.clear()
+        after = [self.count_queries(url) for url in urls]
+        self.assertEqual(after, before)
+
+    def test_ward_autocomplete(self):
+        response = self.client.get('/admin/autocomplete/', {
+            'term': 'bhar', 'app_label': 'api', 'model_name': 'candidates', 'field_name': 'ward'})
+        self.assertEqual(len(response.json()['results']), 20)
+        self.assertTrue(response.json()['pagination']['more'])
+
+    def test_search_reads_an_index_range(self):
+        for model, term, index in [(Candidates, 'CHAIR 1', 'api_candidates_name_idx'), (Candidates, 'c1@example.com', 'api_candidates_email_idx'),
+                                   (ArchivedCandidate, 'chair', 'api_archived_name_idx'), (Ward, 'Bhar', 'api_municipality_name_idx'),
+                                   (Ward, 'bhar 3', 'api_ward_ward_no_municipality_id')]:
+            queryset, _ = admin.site._registry[model].get_search_results(RequestFactory().get('/'), model.objects.all(), term)
+            plan = queryset.explain()
+            self.assertIn(f'INDEX {index}', plan)
+            self.assertNotIn('SCAN', plan)
+        self.assertEqual(len(self.client.get('/admin/api/ward/', {'q': 'BHAR 3'}).context['cl'].result_list), 1)
+        self.assertEqual(len(self.client.get('/admin/api/candidates/', {'q': 'C1@example.com'}).context['cl'].result_list), 1)
+
+    def test_csv_import_queues_a_job(self):
+        with override_settings(MEDIA_ROOT=self.media):
+            response = self.client.post('/admin/api/candidates/import-csv/', {
+                'file': SimpleUploadedFile('c.csv', b'name,gender,post,email,district,municipality,ward\n')})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ImportJob.objects.get().kind, 'candidates')
+
+
+class CandidateExportTests(TestCase):
+    def setUp(self):
+        # exports cost 100 tokens, start every test with a full bucket
+        cache.clear()
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        other = Municipality.objects.create(
+            name='shadanand', type='municipality',
+            district=District.objects.create(name='bhojpur', province=Province.objects.create(name='koshi province')))
+        election = Election.objects.get(is_current=True)
+        for ward_no in range(1, 4):
+            Candidates.objects.create(name=f'Chair <{ward_no}> & co', gender='Male', post='Chairperson', email=f'c{ward_no}@example.com',
+                                      ward=Ward.objects.create(ward_no=ward_no, municipality=municipality), election=election)
+        Candidates.objects.create(name='Elsewhere', gender='Female', post='Member', email='e@example.com',
+                                  ward=Ward.objects.create(ward_no=1, municipality=other), election=election)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='officer', email='officer@example.com', password='strong-pass-123'))
+
+    def test_csv_export_streams_filtered_rows(self):
+        response = self.client.get('/api/candidate/export/', {'format': 'csv', 'province': 'Bagmati Province'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['name', 'gender', 'post'])
+        self.assertEqual(len(lines), 4)
+
+    def test_xlsx_export_is_a_valid_workbook(self):
+        response = self.client.get('/api/candidate/export/', {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = sheet.findall(f'{ns}sheetData/{ns}row')
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1].find(f'{ns}c/{ns}is/{ns}t').text, 'Chair <1> & co')
+
+    def test_bad_election_fails_before_streaming(self):
+        for election, code in [('abc', 400), (Election.objects.latest('id').id + 1, 404)]:
+            response = self.client.get('/api/candidate/export/', {'format': 'csv', 'election': election})
+            self.assertEqual(response.status_code, code)
+            self.assertFalse(response.streaming)
+            self.assertIn('error', response.json())
+
+
+class WardResolveTests(TestCase):
+    def setUp(self):
+        province = Province.objects.create(name='koshi province')
+        taplejung = District.objects.create(name='taplejung', province=province)
+        bhojpur = District.objects.create(name='bhojpur', province=province)
+        self.ward = Ward.objects.create(ward_no=3, municipality=Municipality.objects.create(name='phaktanlung', district=taplejung, type='rural municipality'))
+        for district in (taplejung, bhojpur):
+            Ward.objects.create(ward_no=1, municipality=Municipality.objects.create(name='sundar', district=district, type='municipality'))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='partner', email='partner@example.com', password='strong-pass-123'))
+
+    def test_batch_resolution_with_diagnostics(self):
+        response = self.client.post('/api/wards/resolve/', {'wards': [
+            {'district': 'TAPLEJUNG', 'municipality': 'Phaktanlung Rural Municipality', 'ward_no': 3},
+            {'district': 'ताप्लेजुङ', 'municipality': 'फक्ताङ्लुङ्ग गाउँपालिका', 'ward_no': '३'},
+            {'municipality': 'Sundar', 'ward_no': 1},
+            {'district': 'taplejung', 'municipality': 'nowhere', 'ward_no': 1},
+            {'district': 'taplejung', 'municipality': 'phaktanlung', 'ward_no': 'three'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['resolved', 'resolved', 'ambiguous', 'not_found', 'invalid'])
+        self.assertEqual(results[0]['ward_id'], self.ward.id)
+        self.assertEqual(results[1]['ward_id'], self.ward.id)
+        self.assertEqual(len(results[2]['matches']), 2)
+        self.assertEqual(response.data['summary'], {'resolved': 2, 'not_found': 1, 'ambiguous': 1, 'invalid': 1})
+
+    def test_batch_size_is_capped(self):
+        response = self.client.post('/api/wards/resolve/', {'wards': [{'municipality': 'a', 'ward_no': 1}] * 5001}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class WardLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        district = District.objects.create(name='taplejung', province=Province.objects.create(name='koshi province'))
+        self.municipality = Municipality.objects.create(name='phaktanlung', district=district, type='rural municipality')
+        Ward.objects.create(ward_no=3, municipality=self.municipality)
+
+    def test_lookup_is_kept_per_process_until_the_hierarchy_changes(self):
+        lookup = get_ward_lookup()
+        with self.assertNumQueries(0), patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            self.assertIs(get_ward_lookup(), lookup)
+        # just the version, not the pickled dict
+        self.assertEqual([call.args[0] for call in cache_get.call_args_list], [utils.WARD_LOOKUP_VERSION_KEY])
+        ward = Ward.objects.create(ward_no=4, municipality=self.municipality)
+        self.assertEqual(get_ward_lookup()[('taplejung', 'phaktanlung', 4)], ward.id)
+        # another worker's write: only the shared version tells this process
+        Ward.objects.bulk_create([Ward(ward_no=5, municipality=self.municipality)])
+        self.assertNotIn(('taplejung', 'phaktanlung', 5), get_ward_lookup())
+        cache.set(utils.WARD_LOOKUP_VERSION_KEY, uuid.uuid4().hex, None)
+        self.assertIn(('taplejung', 'phaktanlung', 5), get_ward_lookup())
+
+
+class WardResidentsTests(TestCase):
+    def setUp(self):
+        district = District.objects.create(name='taplejung', province=Province.objects.create(name='koshi province'))
+        self.municipality = Municipality.objects.create(name='phaktanlung', district=district, type='rural municipality')
+        self.ward = Ward.objects.create(ward_no=3, municipality=self.municipality)
+        self.reader = APIClient()
+        self.reader.force_authenticate(User.objects.create_user(username='reader', email='reader@example.com', password='strong-pass-123', ward=self.ward))
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user(username='admin', email='admin@example.com', password='strong-pass-123', is_staff=True))
+
+    def test_resident_counts_are_for_admins_only(self):
+        self.assertEqual(self.reader.get('/api/wards/residents/count/').status_code, 403)
+        self.assertEqual(APIClient().get('/api/wards/residents/count/').status_code, 401)
+        response = self.admin.get('/api/wards/residents/count/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'ward_id': self.ward.id, 'residents': 1}])
+
+    def test_resident_counts_filter_by_numeric_ids(self):
+        response = self.admin.get('/api/wards/residents/count/', {'municipality_id': self.municipality.id})
+        self.assertEqual(response.data, [{'ward_id': self.ward.id, 'residents': 1}])
+        for params in [{'municipality_id': 'abc'}, {'district_id': '1.5'}]:
+            self.assertEqual(self.admin.get('/api/wards/residents/count/', params).status_code, 400)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        province = Province.objects.create(name='bagmati province')
+        self.district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=self.district, type='metropolitan city')
+        Candidates.objects.create(name='Chair', gender='Male', post='Chairperson', email='c@example.com', bio='x' * 1000,
+                                  ward=Ward.objects.create(ward_no=1, municipality=municipality, info='y' * 1000),
+                                  election=Election.objects.get(is_current=True))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='reader', email='reader@example.com', password='strong-pass-123'))
+
+    def test_bio_is_deferred_unless_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/candidate/').data
+        self.assertNotIn('bio', data[0])
+        self.assertFalse(any('"bio"' in q['sql'] or '"info"' in q['sql'] for q in queries.captured_queries))
+        data = self.client.get('/api/candidate/', {'fields': 'name,bio'}).data
+        self.assertEqual(set(data[0]), {'name', 'bio'})
+
+    def test_fields_and_exclude_trim_query_and_output(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/municipalities/', {'fields': 'id,name'}).data
+        self.assertEqual(data, [{'id': Municipality.objects.get().id, 'name': 'bharatpur'}])
+        self.assertNotIn('"type"', queries.captured_queries[-1]['sql'])
+        data = self.client.get(f'/api/municipalities/by-district/{self.district.id}/', {'exclude': 'district'}).data
+        self.assertEqual(set(data[0]), {'id', 'name', 'type'})
+
+    def test_unknown_field_is_rejected(self):
+        self.assertEqual(self.client.get('/api/provinces/', {'fields': 'population'}).status_code, 400)
+
+
+class WardInfoTests(TestCase):
+    def setUp(self):
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        self.municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        for ward_no, population in [(1, 5000), (2, 12000), (3, 8000)]:
+            Ward.objects.create(ward_no=ward_no, municipality=self.municipality,
+                                info={'population': population, 'office_phone': f'056-{ward_no}', 'notes': 'n' * 500})
+        Ward.objects.create(ward_no=4, municipality=self.municipality)
+
+    def test_filter_and_sort_by_promoted_key(self):
+        data = self.client.get('/api/wards/', {'population_min': 6000, 'ordering': '-population'}).json()
+        self.assertEqual([ward['ward_no'] for ward in data], [2, 3])
+        self.assertNotIn('info', data[0])
+        plan = str(Ward.objects.filter(population__gte=6000).explain())
+        self.assertIn('api_ward_population_idx', plan)
+
+    def test_only_selected_info_keys_are_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/wards/', {'info_keys': 'office_phone', 'fields': 'ward_no'}).json()
+        self.assertEqual(data[0], {'ward_no': 1, 'info': {'office_phone': '056-1'}})
+        self.assertEqual(data[3], {'ward_no': 4, 'info': {'office_phone': None}})
+        # the blob is only touched inside JSON_* extraction calls, never selected whole
+        sql = re.sub(r'JSON_\w+\([^)]*\)', '', queries.captured_queries[-1]['sql'])
+        self.assertNotIn('"info"', sql)
+
+    def test_full_info_on_request(self):
+        data = self.client.get('/api/wards/', {'fields': 'info', 'municipality_id': self.municipality.id}).json()
+        self.assertEqual(data[1]['info']['population'], 12000)
+
+    def test_negative_paging_is_rejected(self):
+        for params in [{'limit': -1}, {'limit': 0}, {'offset': -5}, {'limit': 'all'}]:
+            self.assertEqual(self.client.get('/api/wards/', params).status_code, 400)
+        self.assertEqual(WardList().get_throttle_cost(SimpleNamespace(query_params={'limit': '-1000'})), 1)
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='strong-pass-123', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        ward = Ward.objects.get(ward_no=1)
+        for params in [{'limit': -1}, {'after': -1}]:
+            self.assertEqual(client.get(f'/api/wards/{ward.id}/residents/', params).status_code, 400)
+
+
+class VerifyGeographyTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source = f'{self.tmp}/geo.json'
+        with open(self.source, 'w') as f:
+            json.dump(GEOGRAPHY, f)
+
+    def test_load_data_reports_differences_from_official_sources(self):
+        output = f'{self.tmp}/diff.json'
+        call_command('load_data', file=self.source, verify_output=output, stdout=io.StringIO(), stderr=io.StringIO())
+        with open(output) as f:
+            diff = json.load(f)
+        self.assertIn('kathmandu', diff['districts']['missing'])
+        self.assertEqual(diff['districts']['renamed'], {'chitawan': 'chitwan'})
+        self.assertNotIn(['chitwan', 'bharatpur'], diff['local_units']['extra'])
+        mismatches = {(m['district'], m['category'], m['unit']): (m['expected'], m['actual']) for m in diff['counts']['mismatches']}
+        self.assertEqual(mismatches[('chitwan', 'metropolitan', 'wards')], (29, 3))
+        self.assertEqual(mismatches[('bhojpur', 'municipality', 'local_bodies')], (2, 1))
+        self.assertNotIn(('chitwan', 'metropolitan', 'local_bodies'), mismatches)
+
+    def test_strict_mode_fails_and_counts_come_from_one_query(self):
+        call_command('load_data', file=self.source, skip_verify=True, stdout=io.StringIO(), stderr=io.StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaisesMessage(CommandError, 'Geography differs'):
+                call_command('verify_geography', strict=True, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(len(queries), 2)
+
+
+class StartupBenchmarkTests(TestCase):
+    def test_prod_settings_stay_within_budget(self):
+        out = io.StringIO()
+        call_command('startup_benchmark', runs=1, requests=20, setup_budget=30, middleware_budget=50,
+                     stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['forbidden_modules'], [])
+        self.assertNotIn('debug_toolbar.middleware.DebugToolbarMiddleware', report['middleware'])
+
+    def test_dev_settings_fail_the_import_budget(self):
+        with self.assertRaisesMessage(CommandError, 'imported at startup: debug_toolbar, environ'):
+            call_command('startup_benchmark', settings_module='myproject.settings.dev', runs=1, requests=20,
+                         setup_budget=30, middleware_budget=1000, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+@skipUnless(settings.CANDIDATE_SHARDS, "run with --settings=myproject.settings.sharded")
+class ShardingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.election = Election.objects.get(is_current=True)
+        self.wards = {}
+        for province_name, district_name in [('koshi', 'bhojpur'), ('bagmati', 'chitwan')]:
+            province = Province.objects.create(name=province_name)
+            district = District.objects.create(name=district_name, province=province)
+            municipality = Municipality.objects.create(name=f'{district_name} town', district=district, type='municipality')
+            self.wards[province_name] = Ward.objects.create(ward_no=1, municipality=municipality)
+        self.koshi = Candidates.objects.create(name='Koshi Candidate', gender='Male', post='Member', email='k@example.com',
+                                               ward=self.wards['koshi'], election=self.election)
+        self.bagmati = Candidates.objects.create(name='Bagmati Candidate', gender='Female', post='Member', email='b@example.com',
+                                                 ward=self.wards['bagmati'], election=self.election)
+        self.koshi_db, self.bagmati_db = settings.CANDIDATE_SHARDS['koshi'], settings.CANDIDATE_SHARDS['bagmati']
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', email='admin@example.com', password='strong-pass-123'))
+
+    def test_rows_live_in_their_province_shard_with_directory_ids(self):
+        self.assertEqual(list(Candidates.objects.using(self.koshi_db).values_list('id', flat=True)), [self.koshi.id])
+        self.assertEqual(list(Candidates.objects.using(self.bagmati_db).values_list('id', flat=True)), [self.bagmati.id])
+        self.assertFalse(Candidates.objects.using('default').exists())
+        self.assertNotEqual(self.koshi.id, self.bagmati.id)
+        self.assertEqual(Candidates.objects.for_id(self.bagmati.id).get(pk=self.bagmati.id).ward, self.wards['bagmati'])
+        self.assertEqual(self.client.delete(f'/api/candidate/{self.bagmati.id}/').status_code, 204)
+        self.assertFalse(Candidates.objects.using(self.bagmati_db).exists())
+
+    def test_single_province_read_touches_one_shard(self):
+        with CaptureQueriesContext(connections[self.koshi_db]) as koshi, CaptureQueriesContext(connections[self.bagmati_db]) as bagmati:
+            data = self.client.get('/api/candidate/', {'province': 'bagmati'}).data
+        self.assertEqual([row['name'] for row in data], ['Bagmati Candidate'])
+        self.assertEqual(len(koshi), 0)
+        self.assertEqual(len(bagmati), 1)
+        self.assertNotIn('ward_id', bagmati.captured_queries[0]['sql'])
+
+    def test_cross_province_read_gathers_every_shard(self):
+        data = self.client.get('/api/candidate/').data
+        self.assertEqual(sorted(row['name'] for row in data), ['Bagmati Candidate', 'Koshi Candidate'])
+        data = self.client.get('/api/candidate/', {'district': 'bhojpur'}).data
+        self.assertEqual([row['name'] for row in data], ['Koshi Candidate'])
+
+    def test_bulk_writes_changes_and_export_follow_the_shards(self):
+        Candidates.objects.bulk_create([
+            Candidates(name='Koshi Chair', gender='Male', post='Chairperson', email='c@example.com',
+                       ward=self.wards['koshi'], election=self.election),
+        ])
+        self.assertEqual(Candidates.objects.using(self.koshi_db).count(), 2)
+        feed = changes_since(0)
+        names = {change['data']['name'] for change in feed['changes'] if change['model'] == 'candidate'}
+        self.assertEqual(names, {'Koshi Candidate', 'Bagmati Candidate'})
+        rows = list(export_rows({'election_id': self.election.id}))
+        self.assertEqual([row[0] for row in rows[1:]], ['Koshi Candidate', 'Bagmati Candidate', 'Koshi Chair'])
+        self.assertEqual(rows[2][4:8], ('bagmati', 'chitwan', 'chitwan town', 1))
+
+    def test_legacy_rows_are_moved_keeping_their_ids(self):
+        Candidates.objects.using('default').bulk_create([
+            Candidates(id=5000, name='Old Candidate', gender='Male', post='Chairperson', email='o@example.com',
+                       ward_id=self.wards['koshi'].id, election_id=self.election.id),
+        ])
+        call_command('shard_candidates', stdout=io.StringIO())
+        self.assertFalse(Candidates.objects.using('default').exists())
+        self.assertEqual(Candidates.objects.for_id(5000).get(pk=5000).name, 'Old Candidate')
+        fresh = Candidates.objects.create(name='New Candidate', gender='Male', post='Vice-Chairperson', email='n@example.com',
+                                          ward=self.wards['koshi'], election=self.election)
+        self.assertGreater(fresh.id, 5000)
+
+    def test_deletes_cascade_and_protect_across_shards(self):
+        self.wards['koshi'].delete()
+        self.assertFalse(Candidates.objects.using(self.koshi_db).exists())
+        self.assertFalse(DuplicateFlag.objects.exists() or CandidateSignature.objects.filter(candidate_id=self.koshi.id).exists())
+        # raised inside the delete's transaction, like an IntegrityError would be
+        with self.assertRaises(ProtectedError), transaction.atomic():
+            self.election.delete()
+        self.assertTrue(Election.objects.filter(pk=self.election.pk).exists())
+        # a province takes its wards' candidates with it
+        Province.objects.get(name='bagmati').delete()
+        self.assertFalse(Candidates.objects.using(self.bagmati_db).exists())
+        self.election.delete()
+
+
+@skipUnless(settings.CANDIDATE_SHARDS, "run with --settings=myproject.settings.sharded")
+class ShardGatherTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_shards_are_read_concurrently_outside_transactions(self):
+        cache.clear()
+        election, _ = Election.objects.get_or_create(is_current=True, defaults={'name': 'Current election'})
+        for province_name in settings.CANDIDATE_SHARDS:
+            province = Province.objects.create(name=province_name)
+            district = District.objects.create(name=f'{province_name} district', province=province)
+            municipality = Municipality.objects.create(name='town', district=district, type='municipality')
+            ward = Ward.objects.create(ward_no=1, municipality=municipality)
+            Candidates.objects.create(name=province_name, gender='Male', post='Member', email='x@example.com',
+                                      ward=ward, election=election)
+        threads = set()
+        original = sharding.evaluate
+
+        def evaluate(queryset):
+            threads.add(threading.get_ident())
+            return original(queryset)
+
+        with patch.object(sharding, 'evaluate', evaluate):
+            rows = sharding.gather(queryset for _, queryset in sharding.split(Candidates.objects.all()))
+        self.assertEqual(sorted(row.name for row in rows), sorted(settings.CANDIDATE_SHARDS))
+        self.assertGreater(len(threads), 1)
+
+
+class ReadThroughCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['ward 1']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(caching.read_through('wards', 'hot', compute)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['ward 1']] * 8)
+        metrics = caching.cache_metrics()
+        self.assertEqual((metrics['miss'], metrics['coalesced']), (1, 7))
+
+    def test_stale_value_is_served_while_one_request_refreshes(self):
+        caching.read_through('wards', 'page', lambda: 'old', ttl=0, stale=60)
+        key = f"{caching.KEY_PREFIX}:wards:{caching.generation('wards')}:page"
+        cache.add(f'{key}:lock', 'someone else', 10)
+        self.assertEqual(caching.read_through('wards', 'page', lambda: 'new', ttl=0, stale=60), 'old')
+        cache.delete(f'{key}:lock')
+        self.assertEqual(caching.read_through('wards', 'page', lambda: 'new', ttl=0, stale=60), 'new')
+        self.assertEqual(caching.cache_metrics()['stale'], 2)
+
+    def test_expensive_entries_refresh_early(self):
+        def slow():
+            time.sleep(0.05)
+            return 'value'
+
+        # a 50ms computation with a second left: only the unlucky tail of draws refreshes
+        caching.read_through('wards', 'page', slow, ttl=1)
+        with patch.object(caching.random, 'random', return_value=0.5):
+            self.assertEqual(caching.read_through('wards', 'page', lambda: 'refreshed', ttl=1), 'value')
+        with patch.object(caching.random, 'random', return_value=1 - 1e-12):
+            self.assertEqual(caching.read_through('wards', 'page', lambda: 'refreshed', ttl=1), 'refreshed')
+        self.assertEqual(caching.cache_metrics()['early_refresh'], 1)
+
+    def test_candidate_responses_are_cached_until_a_write(self):
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        ward = Ward.objects.create(ward_no=1, municipality=municipality)
+        election = Election.objects.get(is_current=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', email='admin@example.com', password='strong-pass-123'))
+        Candidates.objects.create(name='First', gender='Male', post='Member', email='a@example.com', ward=ward, election=election)
+
+        self.assertEqual(len(self.client.get('/api/candidate/', {'district': 'chitwan'}).data), 1)
+        # served from the cache, the current election id is cached as well
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get('/api/candidate/', {'district': 'chitwan'}).data), 1)
+        Candidates.objects.create(name='Second', gender='Male', post='Chairperson', email='b@example.com', ward=ward, election=election)
+        self.assertEqual(len(self.client.get('/api/candidate/', {'district': 'chitwan'}).data), 2)
+
+        metrics = self.client.get('/api/cache/metrics/').data
+        self.assertEqual((metrics['hit'], metrics['miss']), (1, 2))
+
+    def test_deploy_check_wants_a_cache_shared_by_workers(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['api.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                                   'LOCATION': 'redis://localhost:6379/0'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class TokenBucketThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='reader', email='reader@example.com', password='strong-pass-123'))
+        self.now = 1_000_000.0
+        for patcher in [patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {'user': '100/min', 'ip': None}),
+                        patch.object(TokenBucketThrottle, 'timer', lambda throttle: self.now)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unfiltered_reads_drain_the_bucket_and_get_retry_after(self):
+        self.assertEqual(self.client.get('/api/candidate/').status_code, 200)
+        self.assertEqual(self.client.get('/api/candidate/').status_code, 200)
+        response = self.client.get('/api/candidate/')
+        self.assertEqual(response.status_code, 429)
+        # 50 tokens at 100 a minute
+        self.assertEqual(response['Retry-After'], '30')
+        ward = {'municipality': 'bharatpur', 'ward_no': 1}
+        self.assertEqual(self.client.get('/api/candidate/', ward).status_code, 429)
+
+        self.now += 0.6
+        self.assertEqual(self.client.get('/api/candidate/', ward).status_code, 200)
+        self.assertEqual(self.client.get('/api/candidate/', ward).status_code, 429)
+
+    def test_ward_number_alone_costs_as_much_as_no_filter(self):
+        # ward 1 of every municipality in the country
+        self.assertEqual(self.client.get('/api/candidate/', {'ward_no': 1}).status_code, 200)
+        self.assertEqual(self.client.get('/api/candidate/', {'ward_no': 1}).status_code, 200)
+        self.assertEqual(self.client.get('/api/candidate/', {'ward_no': 1}).status_code, 429)
+        self.assertEqual(self.client.get('/api/candidate/', {'district': 'chitwan', 'ward_no': 1}).status_code, 429)
+        self.now += 3
+        self.assertEqual(self.client.get('/api/candidate/', {'district': 'chitwan', 'ward_no': 1}).status_code, 200)
+
+    def test_idle_time_refills_only_up_to_the_bucket_size(self):
+        self.now += 3600
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/candidate/').status_code, 200)
+        self.assertEqual(self.client.get('/api/candidate/').status_code, 429)
+        self.assertEqual(self.client.get('/api/provinces/').status_code, 429)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(profiling.clear_profiles)
+        province = Province.objects.create(name='bagmati province')
+        district = District.objects.create(name='chitwan', province=province)
+        municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+        Ward.objects.create(ward_no=1, municipality=municipality)
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='strong-pass-123')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='strong-pass-123')
+
+    def client_for(self, user):
+        # the middleware runs before DRF, so it has to see a real JWT rather than force_authenticate
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_staff_request_is_profiled_with_query_plans(self):
+        client = self.client_for(self.admin)
+        response = client.get('/api/wards/', {'district_id': 1}, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        profile_id = int(response['X-Profile-Id'])
+
+        [summary] = client.get('/api/profiles/').data
+        self.assertEqual((summary['id'], summary['reason'], summary['path'], summary['user']), (profile_id, 'requested', '/api/wards/', 'admin'))
+        self.assertEqual(set(summary['timings_ms']), {'total', 'view', 'serializer', 'sql', 'render'})
+
+        detail = client.get(f'/api/profiles/{profile_id}/').data
+        ward_query = next(query for query in detail['queries'] if 'FROM "api_ward"' in query['sql'])
+        self.assertTrue(ward_query['plan'])
+        self.assertIn('cumulative', detail['profile'])
+        self.assertNotIn('pstats', detail)
+
+        dump = client.get(f'/api/profiles/{profile_id}/pstats/')
+        self.assertEqual(dump['Content-Type'], 'application/octet-stream')
+        self.assertTrue(marshal.loads(dump.content))
+
+    def test_flag_is_ignored_for_other_users(self):
+        response = self.client_for(self.reader).get('/api/wards/', {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.recent_profiles(), [])
+        self.assertEqual(self.client_for(self.reader).get('/api/profiles/').status_code, 403)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_BUFFER_SIZE=2)
+    def test_sampling_keeps_only_the_newest_profiles(self):
+        ids = [int(APIClient().get('/api/provinces/')['X-Profile-Id']) for _ in range(3)]
+        profiles = profiling.recent_profiles()
+        self.assertEqual([entry['id'] for entry in profiles], ids[:0:-1])
+        self.assertEqual({entry['reason'] for entry in profiles}, {'sampled'})
+        self.assertIsNone(profiling.get_profile(ids[0]))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_stored_queries_and_sampling_leave_credentials_out(self):
+        response = self.client_for(self.reader).get('/api/candidate/', {'district': 'secret-district'})
+        self.assertEqual(response.status_code, 200)
+        queries = profiling.get_profile(int(response['X-Profile-Id']))['queries']
+        self.assertTrue(any('%s' in query['sql'] for query in queries))
+        self.assertNotIn('secret-district', json.dumps(queries))
+        self.assertTrue(all('params' not in query for query in queries))
+        response = APIClient().post('/api/auth/login/', {'email': 'reader@example.com', 'password': 'strong-pass-123'})
+        self.assertNotIn('X-Profile-Id', response)
+
+
+# load_data runs once per test run; SeededTestCase classes restore its snapshot instead
+SEED_SNAPSHOTS = None
+
+
+def setUpModule():
+    global SEED_SNAPSHOTS
+    SEED_SNAPSHOTS = tempfile.TemporaryDirectory()
+    addModuleCleanup(SEED_SNAPSHOTS.cleanup)
+
+
+def seeded_snapshot():
+    seeded = os.path.join(SEED_SNAPSHOTS.name, 'seeded')
+    if not os.path.isdir(seeded):
+        blank = os.path.join(SEED_SNAPSHOTS.name, 'blank')
+        source = os.path.join(SEED_SNAPSHOTS.name, 'geography.json')
+        with open(source, 'w', encoding='utf-8') as f:
+            json.dump(GEOGRAPHY, f)
+        take_snapshot(blank)
+        try:
+            call_command('load_data', file=source, skip_verify=True, stdout=io.StringIO(), stderr=io.StringIO())
+            take_snapshot(seeded)
+        finally:
+            # committed outside any test, so put the database back the way it was
+            restore_snapshot(blank)
+    return seeded
+
+
+class SeededTestCase(TestCase):
+    """Every test starts from GEOGRAPHY, restored from a snapshot rather than loaded again."""
+    # restoring writes to every shard
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # before TestCase opens its transaction, the backup only copies committed data
+        seeded_snapshot()
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        restore_snapshot(seeded_snapshot())
+
+
+class SnapshotRestoreTests(SeededTestCase):
+    def test_restore_undoes_writes_and_resets_ids(self):
+        self.assertEqual((District.objects.count(), Ward.objects.count()), (2, 6))
+        ward = Ward.objects.get(ward_no=3)
+        resident = User.objects.create_user(username='resident', email='resident@example.com', password='strong-pass-123', ward=ward)
+        next_ward_id = Ward.objects.create(ward_no=9, municipality=ward.municipality).id
+        ward.delete()
+        Province.objects.filter(name__startswith='koshi').delete()
+        status_before = resolve_wards([{'district': 'chitwan', 'municipality': 'bharatpur', 'ward_no': 3}])[0]['status']
+
+        with CaptureQueriesContext(connection) as few_changes:
+            restore_snapshot(seeded_snapshot())
+        self.assertEqual((District.objects.count(), Ward.objects.count()), (2, 6))
+        self.assertEqual(Ward.objects.create(ward_no=10, municipality=ward.municipality).id, next_ward_id)
+        resident.refresh_from_db()
+        self.assertIsNone(resident.ward_id)
+        # the cached ward lookup was dropped along with the old rows
+        self.assertEqual(status_before, 'not_found')
+        self.assertEqual(resolve_wards([{'district': 'chitwan', 'municipality': 'bharatpur', 'ward_no': 3}])[0]['status'], 'resolved')
+
+        # the same kinds of writes on many more rows: a fixed number of statements per table
+        municipality = Municipality.objects.get(name='bharatpur')
+        Ward.objects.bulk_create([Ward(ward_no=ward_no, municipality=municipality) for ward_no in range(20, 120)])
+        Ward.objects.filter(ward_no__in=[2, 3]).delete()
+        Province.objects.filter(name__startswith='koshi').delete()
+        with CaptureQueriesContext(connection) as many_changes:
+            restore_snapshot(seeded_snapshot())
+        self.assertEqual(Ward.objects.count(), 6)
+        self.assertEqual(len(many_changes), len(few_changes))
+
+    def test_change_feed_keeps_counting_through_a_restore(self):
+        ward = Ward.objects.get(ward_no=3)
+        new_ward = Ward.objects.create(ward_no=9, municipality=ward.municipality)
+        ward_id = ward.id
+        ward.delete()
+        # an offline client synced up to here
+        cursor = latest_version()
+
+        restore_snapshot(seeded_snapshot())
+        province = Province.objects.create(name='lumbini province')
+        feed = changes_since(cursor)
+        self.assertGreater(feed['version'], cursor)
+        self.assertEqual({(change['model'], change['id'], change['action']) for change in feed['changes']},
+                         {('ward', ward_id, 'insert'), ('ward', new_ward.id, 'delete'), ('province', province.id, 'insert')})
+
+    def test_taking_a_snapshot_inside_a_transaction_is_refused(self):
+        with self.assertRaisesMessage(CommandError, 'inside a transaction'):
+            call_command('snapshot_data', stdout=io.StringIO())
+
+
+class SnapshotCommandTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_snapshot_and_restore_commands(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        province = Province.objects.create(name='bagmati province')
+        District.objects.create(name='chitwan', province=province)
+        with override_settings(SNAPSHOT_DIR=directory):
+            call_command('snapshot_data', 'staging', stdout=io.StringIO())
+            District.objects.all().delete()
+            District.objects.create(name='bhojpur', province=province)
+            output = io.StringIO()
+            call_command('restore_data', 'staging', stdout=output)
+            self.assertIn("Restored snapshot 'staging'", output.getvalue())
+            self.assertEqual(list(District.objects.values_list('name', flat=True)), ['chitwan'])
+            with self.assertRaisesMessage(CommandError, "No snapshot 'missing'"):
+                call_command('restore_data', 'missing', stdout=io.StringIO())
+
+
+class DuplicateCandidateTests(SeededTestCase):
+    def setUp(self):
+        self.election = Election.objects.get(is_current=True)
+        self.wards = {(ward.municipality.name, ward.ward_no): ward for ward in Ward.objects.select_related('municipality')}
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', email='admin@example.com', password='strong-pass-123'))
+
+    def add(self, name, email, ward, post='Member'):
+        return Candidates.objects.create(name=name, gender='Male', post=post, email=email, ward=self.wards[ward], election=self.election)
+
+    def post(self, name, email, municipality, ward_no, district='chitwan'):
+        return self.client.post('/api/candidate/', {'name': name, 'gender': 'Male', 'post': 'Chairperson', 'email': email,
+                                                    'district': district, 'municipality': municipality, 'ward': ward_no})
+
+    def test_insert_flags_respelled_names_and_emails(self):
+        original = self.add('Ram Bahadur Thapa', 'ram.thapa@example.com', ('bharatpur', 1))
+
+        response = self.post('Dr. Thapa Ram Bahadur', 'other@example.com', 'ratnanagar', 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['possible_duplicates'], [{'duplicate_of_id': original.id, 'reason': 'name', 'score': 1.0}])
+        [flag] = self.post('Ram Bahadur Thapaa', 'third@example.com', 'bharatpur', 2).data['possible_duplicates'][:1]
+        self.assertEqual(flag['reason'], 'similar_name')
+        self.assertGreaterEqual(flag['score'], 0.6)
+        # another district: only the email gives it away
+        response = self.post('R. B. Thapa', 'Ram.Thapa+2079@example.com', 'shadanand', 1, district='bhojpur')
+        self.assertEqual(response.data['possible_duplicates'], [{'duplicate_of_id': original.id, 'reason': 'email', 'score': 1.0}])
+        self.assertEqual(self.post('Sita Kumari Karki', 'sita@example.com', 'bharatpur', 3).data['possible_duplicates'], [])
+
+        original.delete()
+        self.assertFalse(DuplicateFlag.objects.filter(duplicate_of_id=original.id).exists())
+
+    def test_names_without_letters_are_signed_but_never_match(self):
+        self.add('Dr.', 'first@example.com', ('bharatpur', 1))
+        response = self.post('--', 'second@example.com', 'bharatpur', 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['possible_duplicates'], [])
+        # imports sign after bulk_create, which doesn't validate anything
+        blank = Candidates.objects.bulk_create([Candidates(name='', gender='Male', post='Member', email='third@example.com',
+                                                           ward=self.wards[('ratnanagar', 1)], election=self.election)])
+        self.assertEqual(index_candidates(blank), [])
+        self.assertEqual(CandidateSignature.objects.filter(name_key='', minhash=[]).count(), 3)
+        self.assertFalse(DuplicateFlag.objects.exists())
+
+    def test_matches_are_looked_up_through_indexes(self):
+        for number in range(40):
+            self.add(f'Candidate {number} Shrestha', f'c{number}@example.com', ('bharatpur', 1 + number % 3), post=f'Member {number}')
+        candidate = Candidates(pk=10_000, name='Hari Prasad Oli', email='hari@example.com', ward=self.wards[('shadanand', 1)], election=self.election)
+        index_candidates([candidate])
+        signatures = list(CandidateSignature.objects.filter(candidate_id=candidate.pk))
+        plan = shared_signatures(signatures, {candidate.pk: bands(signatures[0])}).explain()
+        # every branch of the OR is an index search, nothing reads the election's signatures
+        self.assertIn('MULTI-INDEX OR', plan)
+        self.assertIn('api_signature_name_idx (district_id=? AND name_key=?)', plan)
+        self.assertIn('api_signature_email_idx (email_key=?)', plan)
+        self.assertNotIn('SCAN api_candidatesignature', plan)
+        self.assertNotIn('election_id', plan)
+
+    def test_import_and_batch_command(self):
+        rows = [{'name': name, 'gender': 'Female', 'post': post, 'email': email, 'district': 'chitwan', 'municipality': 'bharatpur', 'ward': ward}
+                for name, post, email, ward in [('Sita Sharma', 'Member', 'sita@example.com', 1), ('Sita Sarma', 'Member', 's2@example.com', 2),
+                                                ('Gopal Adhikari', 'Chairperson', 'gopal@example.com', 3)]]
+        self.assertEqual(load_candidate_chunk(list(enumerate(rows))), [])
+        sita, sarma = Candidates.objects.filter(name__startswith='Sita').order_by('id')
+        self.assertEqual(list(DuplicateFlag.objects.values_list('candidate_id', 'duplicate_of_id', 'reason')), [(sarma.id, sita.id, 'similar_name')])
+
+        # rows written without signals are only covered by the batch pass
+        Candidates.objects.bulk_create([Candidates(name='Gopal  ADHIKARI', gender='Male', post='Member', email='g@example.com',
+                                                   ward=self.wards[('ratnanagar', 2)], election=self.election)])
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        self.addCleanup(os.remove, output.name)
+        call_command('find_duplicates', output=output.name, stdout=io.StringIO(), stderr=io.StringIO())
+        with open(output.name, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual([(flag['candidate']['name'], flag['duplicate_of']['name'], flag['reason']) for flag in report],
+                         [('Sita Sarma', 'Sita Sharma', 'similar_name'), ('Gopal  ADHIKARI', 'Gopal Adhikari', 'name')])
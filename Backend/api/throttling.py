@@ -0,0 +1,60 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket on top of DRF's rate settings: a rate of '300/min' is a bucket of 300
+    tokens refilled at 5 per second. A request takes view.get_throttle_cost(request)
+    tokens (1 when the view doesn't say), so broad queries drain it faster.
+
+    The bucket is kept GCRA style as one integer per client, the time in microseconds at
+    which it will be full again, and changed only with cache.incr()/decr(): atomic in
+    Redis and Memcached, so the limit holds across workers without a lock.
+    """
+    cache_format = 'throttle:bucket:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        interval = int(self.duration * 1_000_000 / self.num_requests)
+        burst = interval * self.num_requests
+        # a request costing more than the whole bucket could never pass
+        cost = min(getattr(view, 'get_throttle_cost', lambda request: 1)(request), self.num_requests)
+        now = int(self.timer() * 1_000_000)
+
+        self.cache.add(self.key, now, self.duration * 2)
+        full_at = self.cache.incr(self.key, cost * interval)
+        if full_at - cost * interval < now:
+            # the bucket was already full, idle time doesn't earn tokens beyond its size.
+            # Two requests racing here both catch up, which errs on the strict side.
+            full_at = self.cache.incr(self.key, now - (full_at - cost * interval))
+        if full_at - now > burst:
+            self.cache.decr(self.key, cost * interval)
+            self.wait_seconds = (full_at - now - burst) / 1_000_000
+            return False
+        self.cache.touch(self.key, self.duration * 2)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    # per account, anonymous requests are left to the IP bucket
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
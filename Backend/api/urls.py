@@ -1,13 +1,25 @@
 from django.urls import path,include
-from .views import Candidate, MunicipalityList,DistrictList,ProvinceList, DistrictsByProvince, MunicipalitiesByDistrict
+from .views import Candidate, CandidateExport, MunicipalityList,DistrictList,ProvinceList, DistrictsByProvince, MunicipalitiesByDistrict, WardResidentCounts, WardResidents, ImportJobs, ImportJobDetail, Changes, WardResolve, WardList, CacheMetrics, Profiles, ProfileDetail, ProfileStats
 
 urlpatterns = [
     path('auth/',include('login.urls')),
     path('candidate/',Candidate.as_view()),
+    path('candidate/export/', CandidateExport.as_view()),
     path('candidate/<int:pk>/', Candidate.as_view()),
     path('municipalities/', MunicipalityList.as_view()),
     path('districts/', DistrictList.as_view()),
     path('provinces/', ProvinceList.as_view()),
     path('districts/by-province/<int:province_id>/', DistrictsByProvince.as_view()),
     path('municipalities/by-district/<int:district_id>/', MunicipalitiesByDistrict.as_view()),
+    path('wards/', WardList.as_view()),
+    path('wards/resolve/', WardResolve.as_view()),
+    path('wards/residents/count/', WardResidentCounts.as_view()),
+    path('wards/<int:ward_id>/residents/', WardResidents.as_view()),
+    path('jobs/', ImportJobs.as_view()),
+    path('jobs/<int:job_id>/', ImportJobDetail.as_view()),
+    path('changes/', Changes.as_view()),
+    path('cache/metrics/', CacheMetrics.as_view()),
+    path('profiles/', Profiles.as_view()),
+    path('profiles/<int:profile_id>/', ProfileDetail.as_view()),
+    path('profiles/<int:profile_id>/pstats/', ProfileStats.as_view()),
 ]
@@ -0,0 +1,192 @@
+import csv
+import difflib
+import os
+import re
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from .models import Ward, Election
+from .sharding import SHARD_MAP_CACHE_KEY
+
+WARD_LOOKUP_CACHE_KEY = 'api:ward-lookup'
+WARD_LOOKUP_TIMEOUT = 60 * 60
+CURRENT_ELECTION_CACHE_KEY = 'api:current-election'
+WARD_ALIASES_CACHE_KEY = 'api:ward-aliases'
+WARD_LOOKUP_VERSION_KEY = 'api:ward-lookup-version'
+DISTRICT_CODES_CSV = os.path.join(settings.BASE_DIR, 'data/geographical-codes-for-districts.csv')
+LOCAL_BODY_CODES_CSV = os.path.join(settings.BASE_DIR, 'data/geographical-codes-for-local-bodies.csv')
+
+# same suffixes load_data strips off when it stores municipality names, the code lists spell some "Metropolitian"
+municipality_suffix = re.compile(r"\s+(Rural Municipality|Municipality|Sub-Metropolitan City|Metropolitan City|Sub-Metropolitian City|Metropolitian City)$", re.IGNORECASE)
+nepali_municipality_suffix = re.compile(r"\s*(गाउँपालिका|गाउंपालिका|उपमहानगरपालिका|महानगरपालिका|नगरपालिका|नगरापालिका)$")
+
+
+def normalize_name(name):
+    return ' '.join(str(name or '').split()).lower()
+
+
+def normalize_municipality(name):
+    return nepali_municipality_suffix.sub('', municipality_suffix.sub('', normalize_name(name)))
+
+
+def build_ward_lookup():
+    """
+    Map (district, municipality, ward_no) -> ward id for the whole hierarchy.
+    The country has a few thousand wards so one query and a dict is enough.
+    """
+    rows = Ward.objects.values_list('id', 'ward_no', 'municipality__name', 'municipality__district__name')
+    return {
+        (normalize_name(district), normalize_municipality(municipality), ward_no): ward_id
+        for ward_id, ward_no, municipality, district in rows.iterator(chunk_size=2000)
+    }
+
+
+# {cache key: (version, value)}; the lookups are thousands of entries, unpickling them from the
+# cache on every call cost more than the dict lookups themselves
+_ward_memo = {}
+
+
+def ward_lookup_version():
+    return cache.get_or_set(WARD_LOOKUP_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def memoized(key, build):
+    """
+    build() cached per process, and in the cache for the other workers. Both are tagged
+    with the shared version, so a write in any process retires every copy for the price of
+    reading one short key.
+    """
+    version = ward_lookup_version()
+    memo = _ward_memo.get(key)
+    if memo is not None and memo[0] == version:
+        return memo[1]
+    # versioned key: a value built from data older than the write can't land under the new version
+    value = cache.get(f'{key}:{version}')
+    if value is None:
+        value = build()
+        cache.set(f'{key}:{version}', value, WARD_LOOKUP_TIMEOUT)
+    _ward_memo[key] = (version, value)
+    return value
+
+
+def get_ward_lookup():
+    return memoized(WARD_LOOKUP_CACHE_KEY, build_ward_lookup)
+
+
+def clear_ward_lookup(*args, **kwargs):
+    _ward_memo.clear()
+    cache.set(WARD_LOOKUP_VERSION_KEY, uuid.uuid4().hex, None)
+    cache.delete(SHARD_MAP_CACHE_KEY)
+
+
+def closest(name, choices):
+    if name in choices:
+        return name
+    match = difflib.get_close_matches(name, choices, n=1, cutoff=0.6)
+    return match[0] if match else None
+
+
+def build_ward_aliases(lookup):
+    """
+    Nepali district and municipality names mapped onto the English names in the database,
+    taken from the official code lists. Their English spellings differ slightly from the
+    loaded dataset (e.g. "maiwa khola"/"maiwakhola"), so those are matched fuzzily within
+    the district once, here, rather than per request.
+    """
+    municipalities = defaultdict(set)
+    for district, municipality, _ in lookup:
+        municipalities[district].add(municipality)
+    districts = list(municipalities)
+
+    district_aliases = {}
+    with open(DISTRICT_CODES_CSV, encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            match = closest(normalize_name(row['District']), districts)
+            if match:
+                district_aliases[normalize_name(row['जिल्ला'])] = match
+
+    municipality_aliases = {}
+    with open(LOCAL_BODY_CODES_CSV, encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            district = closest(normalize_name(row['District']), districts)
+            if not district:
+                continue
+            match = closest(normalize_municipality(row['Local unit']), list(municipalities[district]))
+            if match:
+                municipality_aliases[(district, normalize_municipality(row['स्थानीय तह']))] = match
+    return district_aliases, municipality_aliases
+
+
+def get_ward_aliases():
+    return memoized(WARD_ALIASES_CACHE_KEY, lambda: build_ward_aliases(get_ward_lookup()))
+
+
+def resolve_ward(district, municipality, ward_no, lookup=None):
+    """Return the Ward id for the given names, or None if it is not in the hierarchy."""
+    try:
+        ward_no = int(ward_no)
+    except (TypeError, ValueError):
+        return None
+    if lookup is None:
+        lookup = get_ward_lookup()
+    return lookup.get((normalize_name(district), normalize_municipality(municipality), ward_no))
+
+
+def resolve_wards(items):
+    """
+    Resolve many (district, municipality, ward_no) dicts in one pass over the cached lookup.
+    Names may be English or Nepali in any case; district may be left out, in which case
+    a municipality name shared by several districts is reported as ambiguous.
+    """
+    lookup = get_ward_lookup()
+    district_aliases, municipality_aliases = get_ward_aliases()
+    by_municipality = defaultdict(list)
+    for (district, municipality, ward_no), ward_id in lookup.items():
+        by_municipality[(municipality, ward_no)].append(ward_id)
+    nepali_municipalities = defaultdict(set)
+    for (_, stem), alias in municipality_aliases.items():
+        nepali_municipalities[stem].add(alias)
+
+    results = []
+    for index, item in enumerate(items):
+        result = {'index': index, 'ward_id': None}
+        try:
+            ward_no = int(str(item.get('ward_no')).strip())
+        except (TypeError, ValueError, AttributeError):
+            result.update(status='invalid', error='ward_no must be a number')
+            results.append(result)
+            continue
+
+        district = normalize_name(item.get('district'))
+        district = district_aliases.get(district, district)
+        municipality = normalize_municipality(item.get('municipality'))
+        if district:
+            municipality = municipality_aliases.get((district, municipality), municipality)
+            ward_id = lookup.get((district, municipality, ward_no))
+            matches = [ward_id] if ward_id else []
+        else:
+            names = nepali_municipalities.get(municipality) or {municipality}
+            matches = [ward_id for name in names for ward_id in by_municipality.get((name, ward_no), [])]
+
+        if len(matches) == 1:
+            result.update(status='resolved', ward_id=matches[0])
+        elif matches:
+            result.update(status='ambiguous', matches=sorted(matches))
+        else:
+            result.update(status='not_found')
+        results.append(result)
+    return results
+
+
+def get_current_election_id():
+    election_id = cache.get(CURRENT_ELECTION_CACHE_KEY)
+    if election_id is None:
+        election_id = Election.objects.filter(is_current=True).values_list('id', flat=True).first()
+        if election_id is not None:
+            cache.set(CURRENT_ELECTION_CACHE_KEY, election_id, WARD_LOOKUP_TIMEOUT)
+    return election_id
+
+
+def clear_current_election(*args, **kwargs):
+    cache.delete(CURRENT_ELECTION_CACHE_KEY)
@@ -1,29 +1,86 @@
 from django.shortcuts import render
-from rest_framework.permissions import IsAuthenticated
-from .serializers import candidateSerializer, MunicipalitySerializer,DistrictSerializer,ProvinceSerializer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.db.models.fields.json import KeyTransform
+import re
+from login.serializers import residentSerializer
+from .serializers import candidateSerializer, archivedCandidateSerializer, WardResolveSerializer, MunicipalitySerializer,DistrictSerializer,ProvinceSerializer,ImportJobSerializer,WardSerializer
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser, FormParser
 from .permissions import IsAdminOrReadOnly
-from .models import Candidates,Ward,Province,Municipality,District
+from .changes import changes_since
+from .export import export_rows, stream_csv, stream_xlsx
+from .renderers import CSVRenderer, XLSXRenderer
+from django.http import StreamingHttpResponse, HttpResponse, JsonResponse
+from rest_framework.renderers import JSONRenderer
+from .models import Candidates,Ward,Province,Municipality,District,ImportJob,Election,ArchivedCandidate,DuplicateFlag
+from .utils import get_current_election_id, resolve_wards
+from .sharding import sharding_enabled, split, gather
+from .caching import read_through, request_key, cache_metrics
+from .profiling import recent_profiles, get_profile
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 # Create your views here.
 
+def sparse_fields(request, serializer_class, default_exclude=()):
+    """
+    Read ?fields= / ?exclude= (comma separated) for serializer_class. Returns the kwargs for
+    the serializer and the model columns those fields need, for QuerySet.only().
+    default_exclude (large text columns) applies unless ?fields= asks for them.
+    """
+    def names(param):
+        value = request.query_params.get(param)
+        return [name.strip() for name in value.split(',') if name.strip()] if value else None
+
+    fields, exclude = names('fields'), names('exclude')
+    available = serializer_class().readable_field_names
+    unknown = (set(fields or []) | set(exclude or [])) - set(available)
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(available)}"})
+    if fields is None:
+        exclude = list(exclude or []) + list(default_exclude)
+    kwargs = {'fields': fields, 'exclude': exclude}
+    return kwargs, serializer_class(**kwargs).model_columns or ['pk']
+
+
 class Candidate(APIView):
     permission_classes=[IsAdminOrReadOnly]
+    # token cost by the scope the filters leave, an unfiltered list serializes the whole table
+    throttle_costs={'ward':1,'municipality':2,'district':5,'province':10}
+    unfiltered_cost=50
+
+    def get_throttle_cost(self,request):
+        if request.method!='GET':
+            return 1
+        params=request.query_params
+        # ward_no only narrows a municipality, on its own it matches that number in every one of them
+        if params.get('municipality'):
+            return self.throttle_costs['ward' if params.get('ward_no') else 'municipality']
+        if params.get('district'):
+            return self.throttle_costs['district']
+        if params.get('province'):
+            return self.throttle_costs['province']
+        return self.unfiltered_cost
+
     def post(self,request):
         candidate=request.data
         serializer=candidateSerializer(data=candidate)
         if serializer.is_valid(raise_exception=True):
-            serializer.save() 
+            candidate_obj=serializer.save()
+            # flagged when the candidate was saved, see api.duplicates; added anyway, an admin reviews them
+            duplicates=DuplicateFlag.objects.filter(candidate_id=candidate_obj.pk).values('duplicate_of_id','reason','score')
             return Response({
-                "message":"Candidate Added sucessfully"
+                "message":"Candidate Added sucessfully",
+                "possible_duplicates":list(duplicates),
             },status=status.HTTP_201_CREATED)
         else :
             return Response(data=serializer.errors,status=401)  
     
     def delete(self,request,pk):
         try:
-            candidate = Candidates.objects.get(pk=pk)
+            candidate = Candidates.objects.for_id(pk).get(pk=pk)
         except Candidates.DoesNotExist:
             return Response({'error': 'Candidate not found'}, status=status.HTTP_404_NOT_FOUND)
         candidate.delete()
@@ -44,46 +101,298 @@ class Candidate(APIView):
             filters['ward__municipality__name'] = municipality
         if ward_no:
             filters['ward__ward_no'] = ward_no
-        print(filters)
-        query_sets=Candidates.objects.filter(**filters
-            ).select_related('ward__municipality__district__province')
         
-        # print(query_sets.query)
-        # for candidate in query_sets:
-        #     print(candidate.__all__)
-        serializer=candidateSerializer(query_sets,many=True)
-       
-        return Response(serializer.data,status=status.HTTP_200_OK)
+        # current-cycle reads only ever touch the current election's rows, past cycles are opt-in
+        model,serializer_class=Candidates,candidateSerializer
+        election_id=request.query_params.get('election')
+        if election_id:
+            try:
+                election_id=int(election_id)
+            except ValueError:
+                return Response({'error': 'election must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            election=Election.objects.filter(pk=election_id).only('id','archived').first()
+            if election is None:
+                return Response({'error': 'Election not found'}, status=status.HTTP_404_NOT_FOUND)
+            if election.archived:
+                model,serializer_class=ArchivedCandidate,archivedCandidateSerializer
+            filters['election_id']=election.id
+        else:
+            filters['election_id']=get_current_election_id()
+        # the filters join what they need, the rows themselves only load the requested columns
+        serializer_kwargs,columns=sparse_fields(request,serializer_class,default_exclude=['bio'])
+
+        def compute():
+            if model is Candidates and sharding_enabled():
+                # one shard when the filters stay inside a province, otherwise all of them at once
+                ward_filters={key[len('ward__'):]:value for key,value in filters.items() if key.startswith('ward__')}
+                election_filter={'election_id':filters['election_id']}
+                parts=split(Candidates.objects.filter(**election_filter).only(*columns),ward_filters)
+                query_sets=gather(queryset for _,queryset in parts)
+            else:
+                query_sets=model.objects.filter(**filters).only(*columns)
+            return list(serializer_class(query_sets,many=True,**serializer_kwargs).data)
+
+        # results night: many clients ask for the same wards at once, see api.caching
+        data=read_through('candidates',request_key(request),compute)
+        return Response(data,status=status.HTTP_200_OK)
+      
+            
+class CandidateExport(APIView):
+    permission_classes=[IsAdminOrReadOnly]
+    renderer_classes=[CSVRenderer, XLSXRenderer, JSONRenderer]
+    throttle_cost = 100
+
+    def get_throttle_cost(self, request):
+        return self.throttle_cost
+
+    def get(self, request):
+        filters = {}
+        for param, lookup in [('province', 'ward__municipality__district__province__name'),
+                              ('district', 'ward__municipality__district__name'),
+                              ('municipality', 'ward__municipality__name')]:
+            value = request.query_params.get(param)
+            if value:
+                filters[lookup] = value.lower()
+        election_id = request.query_params.get('election')
+        if election_id:
+            # checked before streaming starts, after that the status line is already sent; the
+            # CSV/XLSX renderers only pass bodies through, so errors are plain JSON responses
+            try:
+                election_id = int(election_id)
+            except ValueError:
+                return JsonResponse({'error': 'election must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            if not Election.objects.filter(pk=election_id).exists():
+                return JsonResponse({'error': 'Election not found'}, status=status.HTTP_404_NOT_FOUND)
+        filters['election_id'] = election_id or get_current_election_id()
+
+        # rows are read and written as the client downloads them, nothing is built up in memory
+        if request.accepted_renderer.format == 'xlsx':
+            response = StreamingHttpResponse(stream_xlsx(export_rows(filters)), content_type=XLSXRenderer.media_type)
+            extension = 'xlsx'
+        else:
+            response = StreamingHttpResponse(stream_csv(export_rows(filters)), content_type='text/csv; charset=utf-8')
+            extension = 'csv'
+        response['Content-Disposition'] = f'attachment; filename="candidates.{extension}"'
+        return response
       
             
 class MunicipalityList(APIView):
     def get(self, request):
-        municipalities = Municipality.objects.all().order_by('name')
-        serializer = MunicipalitySerializer(municipalities, many=True)
+        serializer_kwargs, columns = sparse_fields(request, MunicipalitySerializer)
+        municipalities = Municipality.objects.all().order_by('name').only(*columns)
+        serializer = MunicipalitySerializer(municipalities, many=True, **serializer_kwargs)
         return Response(serializer.data)
             
             
 class DistrictList(APIView):
     def get(self, request):
-        districts = District.objects.all().order_by('name')
-        serializer = DistrictSerializer(districts, many=True)
+        serializer_kwargs, columns = sparse_fields(request, DistrictSerializer)
+        districts = District.objects.all().order_by('name').only(*columns)
+        serializer = DistrictSerializer(districts, many=True, **serializer_kwargs)
         return Response(serializer.data)
             
 class ProvinceList(APIView):
     def get(self, request):
-        provinces = Province.objects.all().order_by('name')
-        serializer = ProvinceSerializer(provinces, many=True)
+        serializer_kwargs, columns = sparse_fields(request, ProvinceSerializer)
+        provinces = Province.objects.all().order_by('name').only(*columns)
+        serializer = ProvinceSerializer(provinces, many=True, **serializer_kwargs)
         return Response(serializer.data)
 
 class DistrictsByProvince(APIView):
     def get(self, request, province_id):
-        districts = District.objects.filter(province_id=province_id).order_by('name')
-        serializer = DistrictSerializer(districts, many=True)
+        serializer_kwargs, columns = sparse_fields(request, DistrictSerializer)
+        districts = District.objects.filter(province_id=province_id).order_by('name').only(*columns)
+        serializer = DistrictSerializer(districts, many=True, **serializer_kwargs)
         return Response(serializer.data)
 
 class MunicipalitiesByDistrict(APIView):
     def get(self, request, district_id):
-        municipalities = Municipality.objects.filter(district_id=district_id).order_by('name')
-        serializer = MunicipalitySerializer(municipalities, many=True)
+        serializer_kwargs, columns = sparse_fields(request, MunicipalitySerializer)
+        municipalities = Municipality.objects.filter(district_id=district_id).order_by('name').only(*columns)
+        serializer = MunicipalitySerializer(municipalities, many=True, **serializer_kwargs)
         return Response(serializer.data)
 
+
+class WardList(APIView):
+    orderings = {'ward_no': ('municipality_id', 'ward_no'), 'population': ('population', 'id'), '-population': ('-population', '-id')}
+    max_limit = 1000
+
+    def page(self, params):
+        limit = min(int(params.get('limit', 100)), self.max_limit)
+        offset = int(params.get('offset', 0))
+        if limit < 1 or offset < 0:
+            raise ValueError('limit must be at least 1 and offset 0 or more')
+        return limit, offset
+
+    def get_throttle_cost(self, request):
+        # one token per started hundred rows asked for, a rejected page costs one
+        try:
+            limit, _ = self.page(request.query_params)
+        except ValueError:
+            return 1
+        return -(-limit // 100)
+
+    def get(self, request):
+        params = request.query_params
+        filters = {}
+        try:
+            for param, lookup in [('municipality_id', 'municipality_id'), ('district_id', 'municipality__district_id'),
+                                  ('population_min', 'population__gte'), ('population_max', 'population__lte')]:
+                if params.get(param):
+                    filters[lookup] = int(params[param])
+            limit, offset = self.page(params)
+        except ValueError:
+            return Response({'error': 'numeric parameters must be integers, limit at least 1 and offset 0 or more'}, status=status.HTTP_400_BAD_REQUEST)
+        ordering = self.orderings.get(params.get('ordering', 'ward_no'))
+        if ordering is None:
+            return Response({'error': f"ordering must be one of {', '.join(self.orderings)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # the info blob is only read when asked for, and ?info_keys= reads just those keys
+        serializer_kwargs, columns = sparse_fields(request, WardSerializer, default_exclude=['info'])
+        info_keys = [key for key in params.get('info_keys', '').split(',') if key]
+        if any(not re.fullmatch(r'\w+', key) for key in info_keys):
+            return Response({'error': 'info_keys must be comma separated key names'}, status=status.HTTP_400_BAD_REQUEST)
+        wards = Ward.objects.filter(**filters).order_by(*ordering)
+        if info_keys:
+            serializer_kwargs['exclude'] = [name for name in serializer_kwargs['exclude'] or [] if name != 'info']
+            if serializer_kwargs['fields'] is not None and 'info' not in serializer_kwargs['fields']:
+                serializer_kwargs['fields'].append('info')
+            wards = wards.annotate(**{f'info_key_{key}': KeyTransform(key, 'info') for key in info_keys})
+        elif 'info' in WardSerializer(**serializer_kwargs).fields:
+            columns.append('info')
+        wards = wards.only(*columns)[offset:offset + limit]
+
+        def compute():
+            return list(WardSerializer(wards, many=True, context={'info_keys': info_keys}, **serializer_kwargs).data)
+
+        return Response(read_through('wards', request_key(request), compute))
+
+
+class WardResolve(APIView):
+    permission_classes=[IsAuthenticated]
+    def post(self, request):
+        # one request and one in-memory index for the whole roster instead of a request per row
+        serializer = WardResolveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = resolve_wards(serializer.validated_data['wards'])
+        summary = {'resolved': 0, 'not_found': 0, 'ambiguous': 0, 'invalid': 0}
+        for result in results:
+            summary[result['status']] += 1
+        return Response({'summary': summary, 'results': results})
+
+
+class WardResidentCounts(APIView):
+    # where users live is personal data, not a public read
+    permission_classes=[IsAdminUser]
+    def get(self, request):
+        # one GROUP BY over the (ward, id) index instead of string matching on the user table
+        filters = {'ward__isnull': False}
+        try:
+            for param, lookup in [('municipality_id', 'ward__municipality_id'), ('district_id', 'ward__municipality__district_id')]:
+                if request.query_params.get(param):
+                    filters[lookup] = int(request.query_params[param])
+        except ValueError:
+            return Response({'error': 'municipality_id and district_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        counts = (get_user_model().objects.filter(**filters)
+                  .values('ward_id').annotate(residents=Count('id')).order_by('ward_id'))
+        return Response(list(counts))
+
+
+class WardResidents(APIView):
+    permission_classes=[IsAdminUser]
+    page_size = 100
+    max_page_size = 1000
+
+    def get(self, request, ward_id):
+        # keyset pagination: ?after=<last id seen> keeps every page an index range scan
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = min(int(request.query_params.get('limit', self.page_size)), self.max_page_size)
+        except ValueError:
+            return Response({'error': 'after and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if after < 0 or limit < 1:
+            return Response({'error': 'after must be 0 or more and limit at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Ward.objects.filter(pk=ward_id).exists():
+            return Response({'error': 'Ward not found'}, status=status.HTTP_404_NOT_FOUND)
+        residents = list(get_user_model().objects.filter(ward_id=ward_id, id__gt=after)
+                         .order_by('id').only('id', 'first_name', 'last_name', 'username', 'ward_no')[:limit])
+        serializer = residentSerializer(residents, many=True)
+        return Response({
+            'results': serializer.data,
+            'next_after': residents[-1].id if len(residents) == limit else None,
+        })
+
+
+class ImportJobs(APIView):
+    permission_classes=[IsAdminUser]
+    parser_classes=[MultiPartParser, FormParser]
+
+    def post(self, request):
+        # the upload is only stored here, `manage.py run_import_jobs` does the actual import
+        serializer = ImportJobSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(created_by=request.user)
+        return Response({'id': job.id, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobDetail(APIView):
+    permission_classes=[IsAdminUser]
+
+    def get(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(pk=job_id)
+        except ImportJob.DoesNotExist:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ImportJobSerializer(job).data)
+
+
+class CacheMetrics(APIView):
+    permission_classes=[IsAdminUser]
+    def get(self,request):
+        return Response(cache_metrics())
+
+
+class Profiles(APIView):
+    permission_classes=[IsAdminUser]
+    def get(self,request):
+        # summaries only, the statements and the profile are on the detail page
+        summary_fields=['id','created','reason','method','path','query_string','status','user','timings_ms','query_count']
+        return Response([{field:entry[field] for field in summary_fields} for entry in recent_profiles()])
+
+
+class ProfileDetail(APIView):
+    permission_classes=[IsAdminUser]
+    def get(self,request,profile_id):
+        entry=get_profile(profile_id)
+        if entry is None:
+            return Response({'error': 'Profile not found, it may have left the buffer'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({field:value for field,value in entry.items() if field!='pstats'})
+
+
+class ProfileStats(APIView):
+    permission_classes=[IsAdminUser]
+    def get(self,request,profile_id):
+        entry=get_profile(profile_id)
+        if entry is None:
+            return Response({'error': 'Profile not found, it may have left the buffer'}, status=status.HTTP_404_NOT_FOUND)
+        # load with pstats.Stats('profile-<id>.prof')
+        response=HttpResponse(entry['pstats'],content_type='application/octet-stream')
+        response['Content-Disposition']=f'attachment; filename="profile-{profile_id}.prof"'
+        return response
+
+
+class Changes(APIView):
+    permission_classes=[IsAdminOrReadOnly]
+    max_limit = 5000
+
+    def get(self, request):
+        # clients keep the returned version and pass it back as ?since= until has_more is false
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', 1000)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or limit < 1:
+            return Response({'error': 'since must be 0 or more and limit at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(since, limit))
+
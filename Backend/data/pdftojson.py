@@ -1,4 +1,3 @@
-import fitz
 import json
 pdf_path='data.pdf'
 
@@ -7,8 +6,17 @@ pdf_path='data.pdf'
 #     for page in pdf:
 #         text = page.extract_text()
 #         print(text)
-        
-doc = fitz.open(pdf_path)
-for page in doc:
-    text = page.get_text()
-    print(text)       
\ No newline at end of file
+
+
+def main():
+    # PyMuPDF is only needed when this script is run by hand
+    import fitz
+
+    doc = fitz.open(pdf_path)
+    for page in doc:
+        text = page.get_text()
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
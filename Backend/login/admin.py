@@ -1,4 +1,15 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import User
 # Register your models here.
-admin.site.register(User)
\ No newline at end of file
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    list_display = ['username', 'email', 'first_name', 'last_name', 'ward', 'is_staff']
+    list_select_related = ['ward__municipality']
+    search_fields = ['username__istartswith', '=email', 'last_name__istartswith']
+    autocomplete_fields = ['ward']
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ('Residence', {'fields': ('country', 'province', 'district', 'municipality', 'town', 'ward_no', 'ward')}),
+    )
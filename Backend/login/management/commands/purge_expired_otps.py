@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from login.otp import purge_expired_otps
+
+
+class Command(BaseCommand):
+    help="Delete expired one time passcodes, meant to run periodically (e.g. from cron)"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_otps()
+        self.stdout.write(self.style.SUCCESS(f"✅ Removed {deleted} expired OTPs"))
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from login.utils import send_email_batch, email_queue_metrics
+
+
+class Command(BaseCommand):
+    help="Send queued registration and OTP emails in batches over one connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="emails sent per connection")
+        parser.add_argument('--loop', action='store_true', help="keep polling the queue instead of exiting once it is empty")
+        parser.add_argument('--interval', type=float, default=2.0, help="seconds to sleep between polls when idle")
+        parser.add_argument('--stats', action='store_true', help="print queue depth and send latency and exit")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(str(email_queue_metrics()))
+            return
+
+        total_sent = total_failed = 0
+        while True:
+            started = time.perf_counter()
+            sent, failed = send_email_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"sent {sent}, failed {failed} in {time.perf_counter() - started:.2f}s")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Queue drained: {total_sent} sent, {total_failed} failed"))
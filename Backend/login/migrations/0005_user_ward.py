@@ -0,0 +1,78 @@
+# Generated by Django 5.2 on 2026-10-19 18:01
+
+import re
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# copies of api.utils', a migration can't import code that may change after it
+municipality_suffix = re.compile(r"\s+(Rural Municipality|Municipality|Sub-Metropolitan City|Metropolitan City|Sub-Metropolitian City|Metropolitian City)$", re.IGNORECASE)
+nepali_municipality_suffix = re.compile(r"\s*(गाउँपालिका|गाउंपालिका|उपमहानगरपालिका|महानगरपालिका|नगरपालिका|नगरापालिका)$")
+
+
+def normalize_name(name):
+    return ' '.join(str(name or '').split()).lower()
+
+
+def normalize_municipality(name):
+    return nepali_municipality_suffix.sub('', municipality_suffix.sub('', normalize_name(name)))
+
+
+def backfill_user_ward(apps, schema_editor):
+    # historical models can't use api.utils, so the lookup is rebuilt here with the same normalization
+    Ward = apps.get_model('api', 'Ward')
+    User = apps.get_model('login', 'User')
+
+    lookup = {
+        (normalize_name(district), normalize_municipality(municipality), ward_no): ward_id
+        for ward_id, ward_no, municipality, district in Ward.objects.values_list(
+            'id', 'ward_no', 'municipality__name', 'municipality__district__name').iterator()
+    }
+    if not lookup:
+        return
+
+    last_id = 0
+    while True:
+        batch = list(
+            User.objects.filter(id__gt=last_id, ward__isnull=True)
+            .order_by('id')
+            .only('id', 'district', 'municipality', 'ward_no')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        resolved = []
+        for user in batch:
+            try:
+                ward_no = int(user.ward_no)
+            except (TypeError, ValueError):
+                continue
+            key = (normalize_name(user.district), normalize_municipality(user.municipality), ward_no)
+            ward_id = lookup.get(key)
+            if ward_id is not None:
+                user.ward_id = ward_id
+                resolved.append(user)
+        User.objects.bulk_update(resolved, ['ward'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_ward_unique_together_ward_ward_no_and_more'),
+        ('login', '0004_remove_user_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='ward',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='residents', to='api.ward'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['ward', 'id'], name='login_user_ward_id_idx'),
+        ),
+        migrations.RunPython(backfill_user_ward, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-19 18:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def drop_plaintext_codes(apps, schema_editor):
+    # old rows hold unhashed codes with no expiry, nobody can verify against them after this change
+    apps.get_model('login', 'OneTimePassword').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0006_queuedemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_plaintext_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='onetimepassword',
+            name='code',
+        ),
+        migrations.AddField(
+            model_name='onetimepassword',
+            name='code_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='onetimepassword',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='onetimepassword',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='onetimepassword',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser,AbstractBaseUser,PermissionsMixin
 from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _ 
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils import timezone
 # Create your models here.
 
 class User(AbstractUser):
@@ -22,6 +22,8 @@ class User(AbstractUser):
     municipality = models.CharField(max_length=100,blank=False)
     town = models.CharField(max_length=100,blank=False)
     ward_no = models.CharField(max_length=10)
+    # resolved from district/municipality/ward_no at registration, the text fields are kept as entered
+    ward = models.ForeignKey('api.Ward', on_delete=models.SET_NULL, null=True, blank=True, related_name='residents', db_index=False)
     
     date_of_birth = models.DateField(blank=True, null=True)
     
@@ -30,6 +32,12 @@ class User(AbstractUser):
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['first_name','last_name','email','phone_number']
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # serves both "count residents per ward" and keyset listing of a ward ordered by id
+            models.Index(fields=['ward', 'id'], name='login_user_ward_id_idx'),
+        ]
+    
     def __str__(self): # this method returns the username as the name of the object instead of "object" when we fetch it's name in admin or in shell
         return f'{self.first_name} {self.last_name}'
     
@@ -38,15 +46,59 @@ class User(AbstractUser):
         return f'{self.first_name} {self.last_name}'
  
     def get_token(self):
-        refresh=RefreshToken.for_user(self)
+        from .tokens import RevocableRefreshToken
+        refresh=RevocableRefreshToken.for_user(self)
         return {
             'refresh':str(refresh),
             'access':str(refresh.access_token)
         }
        
 class OneTimePassword(models.Model):
+    # database fallback for login.otp, the cache holds the same record with a TTL
     user=models.OneToOneField(User,on_delete=models.CASCADE)
-    code = models.CharField(max_length=4,unique=True)
+    code_hash = models.CharField(max_length=64)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
     def __str__(self):
         return f'{self.user.first_name}--Passcode'
-    
+
+
+class QueuedEmail(models.Model):
+    # outgoing mail is written here on the request thread and sent later by the send_queued_emails command
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='login_email_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.to} ({self.status})'
+
+
+class RevokedToken(models.Model):
+    # rows are only needed until the token would have expired anyway, login.revocation prunes them
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
@@ -0,0 +1,84 @@
+import secrets
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from .models import OneTimePassword
+
+OTP_LENGTH = getattr(settings, 'OTP_LENGTH', 4)
+OTP_TTL = getattr(settings, 'OTP_TTL', timedelta(minutes=10))
+OTP_MAX_ATTEMPTS = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+
+def generate_otp():
+    return ''.join(str(secrets.randbelow(10)) for _ in range(OTP_LENGTH))
+
+
+def _cache_key(user_id):
+    return f'login:otp:{user_id}'
+
+
+def _hash(user_id, code):
+    # salted with the user id, so equal codes for different users never look alike
+    return salted_hmac('login.otp', f'{user_id}:{code}').hexdigest()
+
+
+def issue_otp(user):
+    """
+    Create a fresh code for user, replacing any earlier one, and return it in plain text.
+    Codes are keyed by user, so they don't have to be unique across users.
+    """
+    code = generate_otp()
+    now = timezone.now()
+    record = {'hash': _hash(user.pk, code), 'attempts': 0, 'expires_at': now + OTP_TTL}
+    OneTimePassword.objects.update_or_create(
+        user_id=user.pk,
+        defaults={'code_hash': record['hash'], 'attempts': 0, 'created_at': now, 'expires_at': record['expires_at']},
+    )
+    cache.set(_cache_key(user.pk), record, OTP_TTL.total_seconds())
+    return code
+
+
+def _load(user_id):
+    record = cache.get(_cache_key(user_id))
+    if record is not None:
+        return record
+    # cache was flushed or evicted, fall back to the row (a primary key style lookup on user_id)
+    row = OneTimePassword.objects.filter(user_id=user_id).values('code_hash', 'attempts', 'expires_at').first()
+    if row is None:
+        return None
+    return {'hash': row['code_hash'], 'attempts': row['attempts'], 'expires_at': row['expires_at']}
+
+
+def discard_otp(user_id):
+    cache.delete(_cache_key(user_id))
+    OneTimePassword.objects.filter(user_id=user_id).delete()
+
+
+def verify_otp(user, code):
+    """Return True and consume the code if it matches; wrong guesses count towards OTP_MAX_ATTEMPTS."""
+    record = _load(user.pk)
+    if record is None:
+        return False
+
+    now = timezone.now()
+    if record['expires_at'] <= now or record['attempts'] >= OTP_MAX_ATTEMPTS:
+        discard_otp(user.pk)
+        return False
+
+    if constant_time_compare(record['hash'], _hash(user.pk, code)):
+        discard_otp(user.pk)
+        return True
+
+    record['attempts'] += 1
+    remaining = (record['expires_at'] - now).total_seconds()
+    cache.set(_cache_key(user.pk), record, remaining)
+    OneTimePassword.objects.filter(user_id=user.pk).update(attempts=record['attempts'])
+    return False
+
+
+def purge_expired_otps():
+    """Delete expired rows through the expires_at index. Cache entries expire on their own."""
+    deleted, _ = OneTimePassword.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,118 @@
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import RevokedToken
+
+REVOCATION_CAPACITY = getattr(settings, 'TOKEN_REVOCATION_CAPACITY', 100_000)
+REVOCATION_ERROR_RATE = getattr(settings, 'TOKEN_REVOCATION_ERROR_RATE', 0.001)
+# how stale this process' filter may get before it asks the table for newer revocations
+REVOCATION_SYNC_SECONDS = getattr(settings, 'TOKEN_REVOCATION_SYNC_SECONDS', 1.0)
+REVOCATION_PRUNE_SECONDS = getattr(settings, 'TOKEN_REVOCATION_PRUNE_SECONDS', 300)
+VERSION_CACHE_KEY = 'login:revocation:version'
+
+
+class BloomFilter:
+    """Fixed size bit array; answers "definitely not added" or "maybe added"."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationStore:
+    """
+    Revoked JWT ids, kept in RevokedToken until the token's own expiry.
+
+    Every check first goes through a per-process bloom filter, so the common case (a token
+    that was never revoked) costs a few hash lookups and no query. A filter hit is confirmed
+    against the unique jti index. The filter catches up with other workers by reading rows
+    newer than the last id it has seen, and is rebuilt from live rows when pruning drops
+    expired ones or it fills past capacity.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._version = None
+        self._synced_at = 0.0
+        self._pruned_at = 0.0
+
+    def _rebuild(self):
+        bloom = BloomFilter(REVOCATION_CAPACITY, REVOCATION_ERROR_RATE)
+        last_id = 0
+        rows = RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('id', 'jti')
+        for row_id, jti in rows.iterator(chunk_size=5000):
+            bloom.add(jti)
+            last_id = max(last_id, row_id)
+        self._filter, self._last_id = bloom, last_id
+
+    def _sync(self):
+        now = time.monotonic()
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        if self._filter is not None and version == self._version and now - self._synced_at < REVOCATION_SYNC_SECONDS:
+            return
+        with self._lock:
+            if self._filter is None or self._filter.count > REVOCATION_CAPACITY:
+                self._rebuild()
+            else:
+                for row_id, jti in RevokedToken.objects.filter(id__gt=self._last_id).values_list('id', 'jti'):
+                    self._filter.add(jti)
+                    self._last_id = max(self._last_id, row_id)
+            self._version = version
+            self._synced_at = now
+
+    def prune(self):
+        """Drop rows whose tokens have expired on their own; returns the number deleted."""
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        self._pruned_at = time.monotonic()
+        if deleted:
+            with self._lock:
+                self._rebuild()
+        return deleted
+
+    def revoke(self, jti, expires_at):
+        if expires_at <= timezone.now():
+            return
+        RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, 1, None)
+        self._sync()
+        if time.monotonic() - self._pruned_at > REVOCATION_PRUNE_SECONDS:
+            self.prune()
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).exists()
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._version = None
+
+
+revocations = RevocationStore()
@@ -2,6 +2,9 @@ from rest_framework import serializers
 from .models import User
 from django.contrib.auth import authenticate
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .tokens import RevocableRefreshToken
+from api.utils import resolve_ward
 
 class registerSerializer(serializers.ModelSerializer):
     password=serializers.CharField(max_length=20,min_length=8,write_only=True)
@@ -23,6 +26,11 @@ class registerSerializer(serializers.ModelSerializer):
         if password != re_password:
             raise serializers.ValidationError("Passwords do not match")
         
+        ward_id=resolve_ward(attrs.get('district'),attrs.get('municipality'),attrs.get('ward_no'))
+        if ward_id is None:
+            raise serializers.ValidationError({"ward_no":"No such ward in the given district and municipality"})
+        attrs['ward_id']=ward_id
+        
         # del attrs['re_password']
         return attrs   
         
@@ -71,13 +79,28 @@ class userSerializer(serializers.ModelSerializer):
     isAdmin = serializers.SerializerMethodField()
     class Meta:
         model=User
-        fields=[ 'id','first_name', 'last_name','username','email','isAdmin','phone_number','province','district','date_of_birth','ward_no','municipality']
+        fields=[ 'id','first_name', 'last_name','username','email','isAdmin','phone_number','province','district','date_of_birth','ward_no','municipality','ward']
          
     def get_isAdmin(self, obj):
         return obj.is_staff
         
+class residentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model=User
+        fields=['id','first_name','last_name','username','ward_no']
+
+
+class verifyOtpSerializer(serializers.Serializer):
+    email=serializers.EmailField()
+    otp=serializers.CharField(max_length=10)
+
+
 class logoutSerializer(serializers.Serializer):
     refresh_token=serializers.CharField()
+
+
+class refreshSerializer(TokenRefreshSerializer):
+    token_class=RevocableRefreshToken
         
         
     
\ No newline at end of file
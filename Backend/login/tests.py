@@ -1,3 +1,178 @@
-from django.test import TestCase
+import importlib
+from unittest import mock
+from datetime import timedelta
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import utils
+from api.models import Province, District, Municipality, Ward
+from .models import User, QueuedEmail, OneTimePassword, RevokedToken
+from .otp import issue_otp, verify_otp, purge_expired_otps, OTP_MAX_ATTEMPTS
+from .revocation import revocations, BloomFilter
+from .utils import enqueue_email, send_email_batch, email_queue_metrics
 
-# Create your tests here.
+backfill = importlib.import_module('login.migrations.0005_user_ward')
+backfill_user_ward = backfill.backfill_user_ward
+
+
+def make_ward():
+    province = Province.objects.create(name='bagmati province')
+    district = District.objects.create(name='chitwan', province=province)
+    municipality = Municipality.objects.create(name='bharatpur', district=district, type='metropolitan city')
+    return Ward.objects.create(ward_no=22, municipality=municipality)
+
+
+REGISTRATION = {
+    'first_name': 'Sita', 'last_name': 'Sharma', 'email': 'sita@example.com', 'phone_number': '+9779800000000',
+    'gender': 'female', 'country': 'Nepal', 'province': 'Bagmati Province', 'district': 'Chitwan',
+    'municipality': 'Bharatpur Metropolitan City', 'town': 'Bharatpur', 'ward_no': '22',
+    'username': 'sita', 'password': 'strong-pass-123', 're_password': 'strong-pass-123',
+}
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailQueueTests(TestCase):
+    def setUp(self):
+        self.ward = make_ward()
+
+    def test_register_queues_mail_instead_of_sending(self):
+        response = APIClient().post('/api/auth/register/', REGISTRATION, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(username='sita').ward_id, self.ward.id)
+        self.assertEqual(QueuedEmail.objects.filter(status='pending').count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_email_batch(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(QueuedEmail.objects.filter(status='sent').count(), 2)
+        self.assertEqual(email_queue_metrics()['queue_depth'], 0)
+
+    def test_batch_reuses_one_connection(self):
+        for i in range(5):
+            enqueue_email(f'user{i}@example.com', 'hello', 'body')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            self.assertEqual(send_email_batch(batch_size=10), (5, 0))
+        self.assertEqual(open_connection.call_count, 1)
+
+    def test_failed_send_is_retried_later(self):
+        queued = enqueue_email('user@example.com', 'hello', 'body')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('smtp down')):
+            self.assertEqual(send_email_batch(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'pending')
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('smtp down', queued.last_error)
+        # backoff pushed the retry into the future, so nothing is due right now
+        self.assertEqual(send_email_batch(), (0, 0))
+        self.assertEqual(email_queue_metrics()['queue_depth'], 1)
+
+    def test_unreachable_server_puts_the_batch_back(self):
+        queued = enqueue_email('user@example.com', 'hello', 'body')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('connection refused')):
+            self.assertEqual(send_email_batch(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_by), ('pending', 0, ''))
+        self.assertIn('connection refused', queued.last_error)
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+
+
+class OtpStoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ram', email='ram@example.com', password='strong-pass-123')
+
+    def test_code_is_hashed_and_single_use(self):
+        code = issue_otp(self.user)
+        self.assertNotEqual(OneTimePassword.objects.get(user=self.user).code_hash, code)
+        self.assertTrue(verify_otp(self.user, code))
+        self.assertFalse(verify_otp(self.user, code))
+
+    def test_same_code_for_two_users_is_allowed(self):
+        other = User.objects.create_user(username='hari', email='hari@example.com', password='strong-pass-123')
+        with mock.patch('login.otp.generate_otp', return_value='1234'):
+            issue_otp(self.user)
+            issue_otp(other)
+        self.assertTrue(verify_otp(other, '1234'))
+
+    def test_falls_back_to_database_when_cache_is_empty(self):
+        code = issue_otp(self.user)
+        cache.clear()
+        self.assertTrue(verify_otp(self.user, code))
+
+    def test_attempts_are_limited(self):
+        code = issue_otp(self.user)
+        for _ in range(OTP_MAX_ATTEMPTS):
+            self.assertFalse(verify_otp(self.user, 'wrong'))
+        self.assertFalse(verify_otp(self.user, code))
+
+    def test_expired_codes_are_rejected_and_swept(self):
+        code = issue_otp(self.user)
+        OneTimePassword.objects.filter(user=self.user).update(expires_at=self.user.date_joined - timedelta(days=1))
+        cache.clear()
+        self.assertEqual(purge_expired_otps(), 1)
+        self.assertFalse(verify_otp(self.user, code))
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        revocations.reset()
+        self.user = User.objects.create_user(username='gita', email='gita@example.com', password='strong-pass-123')
+        self.client = APIClient()
+        self.tokens = self.client.post('/api/auth/login/', {'username': 'gita', 'password': 'strong-pass-123'}, format='json').data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access_token']}")
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 200)
+        response = self.client.post('/api/auth/logout/', {'refresh_token': self.tokens['refresh_token']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 401)
+        refresh = APIClient().post('/api/auth/token/refresh/', {'refresh': self.tokens['refresh_token']}, format='json')
+        self.assertEqual(refresh.status_code, 401)
+
+    def test_unrevoked_refresh_token_still_works(self):
+        refresh = APIClient().post('/api/auth/token/refresh/', {'refresh': self.tokens['refresh_token']}, format='json')
+        self.assertEqual(refresh.status_code, 200)
+
+    def test_prune_drops_expired_rows(self):
+        RevokedToken.objects.create(jti='old', expires_at=self.user.date_joined - timedelta(days=1))
+        self.assertEqual(revocations.prune(), 1)
+        self.assertFalse(revocations.is_revoked('old'))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+class UserWardBackfillTests(TestCase):
+    def test_suffixed_municipality_names_are_resolved(self):
+        ward = make_ward()
+        nepali = Ward.objects.create(ward_no=3, municipality=Municipality.objects.create(
+            name='भरतपुर', district=ward.municipality.district, type='metropolitan city'))
+        users = {
+            'english': ('Bharatpur Metropolitan City', '22', ward),
+            'misspelt': ('Bharatpur Metropolitian City', '22', ward),
+            'sub': ('Bharatpur  Sub-Metropolitian City', '22', ward),
+            'nepali': ('भरतपुर महानगरपालिका', '3', nepali),
+            'unknown': ('Nowhere Municipality', '22', None),
+        }
+        for username, (municipality, ward_no, _) in users.items():
+            User.objects.create_user(username=username, email=f'{username}@example.com', password='strong-pass-123',
+                                     district='Chitwan', municipality=municipality, ward_no=ward_no)
+        User.objects.update(ward=None)
+
+        backfill_user_ward(apps, None)
+        self.assertEqual({user.username: user.ward for user in User.objects.all()},
+                         {username: expected for username, (_, _, expected) in users.items()})
+
+    def test_migration_normalizes_like_the_api(self):
+        self.assertEqual(backfill.municipality_suffix.pattern, utils.municipality_suffix.pattern)
+        self.assertEqual(backfill.nepali_municipality_suffix.pattern, utils.nepali_municipality_suffix.pattern)
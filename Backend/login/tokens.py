@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .revocation import revocations
+
+
+class RevocationMixin:
+    # same hook simplejwt's BlacklistMixin uses, but backed by login.revocation
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if revocations.is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError("Token has been revoked")
+
+    def revoke(self):
+        expires_at = datetime.fromtimestamp(self['exp'], tz=timezone.utc)
+        revocations.revoke(self[api_settings.JTI_CLAIM], expires_at)
+
+
+class RevocableAccessToken(RevocationMixin, AccessToken):
+    pass
+
+
+class RevocableRefreshToken(RevocationMixin, RefreshToken):
+    access_token_class = RevocableAccessToken
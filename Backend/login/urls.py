@@ -1,9 +1,12 @@
 
 from django.urls import path
-from .views import Register,Login,LogOut,userInfo
+from .views import Register,Login,LogOut,userInfo,EmailQueueMetrics,VerifyOtp,TokenRefresh
 urlpatterns = [
     path('register/',Register.as_view(),name='register'),
+    path('verify-otp/',VerifyOtp.as_view(),name='verify-otp'),
     path('login/',Login.as_view(),name='login'),
     path('logout/',LogOut.as_view(),name='logout'),
-    path('user/',userInfo.as_view(),name='user')
+    path('token/refresh/',TokenRefresh.as_view(),name='token-refresh'),
+    path('user/',userInfo.as_view(),name='user'),
+    path('email-queue/metrics/',EmailQueueMetrics.as_view(),name='email-queue-metrics'),
 ]
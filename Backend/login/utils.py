@@ -1,16 +1,122 @@
-import random 
-from django.core.mail import EmailMessage
-from .models import User,OneTimePassword
-def generate_otp():
-    otp=''
-    for i in range (4):
-        otp += str(random.randint(0,9))
-    return otp
+import os
+import socket
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import User,QueuedEmail
+from .otp import generate_otp, issue_otp, OTP_TTL
+
+EMAIL_MAX_ATTEMPTS = getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 5)
+EMAIL_RETRY_BASE_SECONDS = getattr(settings, 'EMAIL_QUEUE_RETRY_BASE_SECONDS', 30)
+# rows stuck in "sending" longer than this belong to a worker that died mid batch
+EMAIL_LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def enqueue_email(to, subject, body):
+    return QueuedEmail.objects.create(to=to, subject=subject, body=body)
+
 
 def send_otp(email):
     Subject='OTP Code'
-    otp_code=generate_otp()
-    print(otp_code)
     user=User.objects.get(email=email)
+    otp_code=issue_otp(user)
     current_site='myAuth.com'
-    pass
\ No newline at end of file
+    minutes=int(OTP_TTL.total_seconds() // 60)
+    body=f'Hi {user.first_name}, thanks for signing up on {current_site}. Your one time passcode is {otp_code}, it expires in {minutes} minutes.'
+    return enqueue_email(user.email, Subject, body)
+
+
+def send_welcome_email(user):
+    body=f'Hi {user.first_name}, your account "{user.username}" has been created. You can now log in.'
+    return enqueue_email(user.email, 'Welcome', body)
+
+
+def claim_emails(batch_size):
+    """Mark up to batch_size due emails as ours so concurrent workers never send the same row twice."""
+    now = timezone.now()
+    token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    due = (
+        Q(status='pending', next_attempt_at__lte=now)
+        | Q(status='sending', locked_at__lt=now - EMAIL_LOCK_TIMEOUT)
+    )
+    ids = list(QueuedEmail.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    QueuedEmail.objects.filter(due, id__in=ids).update(status='sending', locked_by=token, locked_at=now)
+    return list(QueuedEmail.objects.filter(locked_by=token, status='sending').order_by('id'))
+
+
+def send_email_batch(batch_size=100, connection=None):
+    """
+    Send one batch of queued emails over a single backend connection.
+    Each message is sent on its own so one bad address only fails that row; failures are
+    retried with exponential backoff until EMAIL_MAX_ATTEMPTS. Returns (sent, failed).
+    """
+    emails = claim_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # the server never saw these: back in the queue for a later batch, no attempt used up
+        QueuedEmail.objects.filter(id__in=[queued.id for queued in emails]).update(
+            status='pending', locked_by='', locked_at=None, last_error=str(e),
+            next_attempt_at=timezone.now() + timedelta(seconds=EMAIL_RETRY_BASE_SECONDS))
+        return 0, len(emails)
+    try:
+        for queued in emails:
+            message = EmailMessage(queued.subject, queued.body, settings.DEFAULT_FROM_EMAIL, [queued.to], connection=connection)
+            queued.attempts += 1
+            queued.locked_by = ''
+            queued.locked_at = None
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                queued.last_error = str(e)
+                if queued.attempts >= EMAIL_MAX_ATTEMPTS:
+                    queued.status = 'failed'
+                else:
+                    queued.status = 'pending'
+                    queued.next_attempt_at = timezone.now() + timedelta(seconds=EMAIL_RETRY_BASE_SECONDS * 2 ** (queued.attempts - 1))
+            else:
+                sent += 1
+                queued.status = 'sent'
+                queued.sent_at = timezone.now()
+                queued.last_error = ''
+    finally:
+        connection.close()
+        QueuedEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'last_error', 'next_attempt_at', 'locked_by', 'locked_at', 'sent_at'])
+    return sent, failed
+
+
+def email_queue_metrics(sample_size=1000):
+    now = timezone.now()
+    pending = QueuedEmail.objects.filter(status__in=['pending', 'sending'])
+    oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+    recent = QueuedEmail.objects.filter(status='sent').order_by('-sent_at').values_list('created_at', 'sent_at')[:sample_size]
+    latencies = sorted((sent_at - created_at).total_seconds() for created_at, sent_at in recent)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+
+    return {
+        'queue_depth': pending.count(),
+        'failed': QueuedEmail.objects.filter(status='failed').count(),
+        'oldest_pending_age_seconds': round((now - oldest).total_seconds(), 3) if oldest else None,
+        'send_latency_seconds': {
+            'samples': len(latencies),
+            'avg': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+        },
+    }
@@ -2,13 +2,19 @@ from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .serializers import registerSerializer,userSerializer,loginSerializer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .serializers import registerSerializer,userSerializer,loginSerializer,verifyOtpSerializer,logoutSerializer,refreshSerializer
+from .models import User
+from .otp import verify_otp
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.views import TokenRefreshView
+from .tokens import RevocableRefreshToken
 from rest_framework.authtoken.models import Token
+from django.db import transaction
+from .utils import send_otp, send_welcome_email, email_queue_metrics
 
 # Create your views here.
 
@@ -16,16 +22,33 @@ class Register(APIView):
     serializer_class=registerSerializer
     def post(self,request):
         data=request.data
-        print(data)
         serailizer=self.serializer_class(data=data)
         if serailizer.is_valid(raise_exception=True):       # here is_valid() calls validation function from serializer.
-            serailizer.save()
+            with transaction.atomic():
+                user=serailizer.save()
+                # only queued here, the send_queued_emails worker delivers them off the request thread
+                send_welcome_email(user)
+                send_otp(user.email)
             return Response({
                 "message": "Registration successful. Please log in.",
             },status=status.HTTP_201_CREATED)
         return Response(serailizer.errors, status=status.HTTP_400_BAD_REQUEST)
          
         
+class VerifyOtp(APIView):
+    def post(self,request):
+        serializer=verifyOtpSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user=User.objects.filter(email=serializer.validated_data['email']).only('id').first()
+        if user is None or not verify_otp(user,serializer.validated_data['otp']):
+            return Response({
+                'msg':'Invalid or expired OTP'
+            },status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'msg':'OTP verified'
+        })
+        
+        
 class Login(APIView):
     def post(self,request):
         data=request.data
@@ -44,16 +67,29 @@ class userInfo(APIView):
 class LogOut(APIView):
     permission_classes=[IsAuthenticated]
     def post(self,request):
+        serializer=logoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         try:
-            data=request.data
-            refresh_token=data['refresh_token']
-            token=RefreshToken(refresh_token)
-            token.blacklist()
-            return Response({
-                'msg':'Logged Out sucessfully'
-            })
-        except Exception as e:
+            token=RevocableRefreshToken(serializer.validated_data['refresh_token'])
+        except TokenError:
             return Response({
                 'msg':'Invalid Token'
-            })
-        
\ No newline at end of file
+            },status=status.HTTP_400_BAD_REQUEST)
+        token.revoke()
+        # the access token used for this request would otherwise stay valid until it expires
+        if hasattr(request.auth,'revoke'):
+            request.auth.revoke()
+        return Response({
+            'msg':'Logged Out sucessfully'
+        })
+
+
+class TokenRefresh(TokenRefreshView):
+    serializer_class=refreshSerializer
+
+
+class EmailQueueMetrics(APIView):
+    permission_classes=[IsAdminUser]
+    def get(self,request):
+        return Response(email_queue_metrics())
+
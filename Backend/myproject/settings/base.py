@@ -0,0 +1,242 @@
+
+"""
+Django settings for myproject project, shared by dev.py and prod.py.
+
+Generated by 'django-admin startproject' using Django 5.2.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+import os
+from pathlib import Path
+
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+_REQUIRED=object()
+
+
+def env(name,default=_REQUIRED,cast=str):
+    # plain os.environ reads, dev.py loads .env into the environment before this module runs
+    value=os.environ.get(name)
+    if value is None:
+        if default is _REQUIRED:
+            raise ImproperlyConfigured(f"Set the {name} environment variable")
+        return default
+    if cast is bool:
+        return value.strip().lower() in ('1','true','yes','on')
+    if cast is list:
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return cast(value)
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY=env('SECRET_KEY')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = env('DEBUG',default=False,cast=bool)
+
+ALLOWED_HOSTS = env('ALLOWED_HOSTS',default=[],cast=list)
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'corsheaders',
+    'api',
+    'login',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.ProfilingMiddleware',
+]
+
+ROOT_URLCONF = 'myproject.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'myproject.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+}
+
+# Read-through cache for candidate and ward responses, see api/caching.py. One request per key
+# recomputes at a time, others wait up to READ_THROUGH_WAIT and then compute it themselves; that
+# lock is only shared between workers when the cache is (manage.py check --deploy warns otherwise)
+READ_THROUGH_TTL = 30
+READ_THROUGH_STALE = 300
+READ_THROUGH_BETA = 1.0
+READ_THROUGH_LOCK_TIMEOUT = 10
+READ_THROUGH_WAIT = 5
+READ_THROUGH_POLL_INTERVAL = 0.05
+
+# Staff profiling with X-Profile: 1 or ?_profile=1, see api/profiling.py
+PROFILING_QUERY_PARAM = '_profile'
+PROFILING_BUFFER_SIZE = env('PROFILING_BUFFER_SIZE', default=50, cast=int)
+# profile 1 in N requests of anyone, 0 turns sampling off
+PROFILING_SAMPLE_RATE = env('PROFILING_SAMPLE_RATE', default=0, cast=int)
+# ...except under these path prefixes: logins, OTPs and tokens
+PROFILING_SAMPLE_EXCLUDE = ['/api/auth/']
+PROFILING_EXPLAIN_LIMIT = 50
+
+# estimated trigram similarity from which two names in a district are flagged, see api/duplicates.py
+DUPLICATE_NAME_THRESHOLD = 0.6
+
+# snapshot_data/restore_data keep their copies here, see api/snapshots.py
+SNAPSHOT_DIR = env('SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots'))
+
+# Optional: keep Candidates rows in per-province databases, see api/sharding.py.
+# Province name -> database alias, provinces left out stay in 'default'.
+CANDIDATE_SHARDS = {}
+DATABASE_ROUTERS = ['api.routers.ProvinceShardRouter']
+
+CORS_ALLOWED_ORIGINS = env('CORS_ALLOWED_ORIGINS',default=[
+    "http://localhost:5173",  # React dev server
+],cast=list)
+
+REST_FRAMEWORK = {
+
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+
+        'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ),
+    # token buckets, see api/throttling.py; views can charge more than one token per request.
+    # Buckets live in the default cache: per process with dev's LocMemCache, prod uses Redis
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.IPTokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user': env('THROTTLE_RATE_USER', default='600/min'),
+        'ip': env('THROTTLE_RATE_IP', default='1200/min'),
+    },
+
+}
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+AUTH_USER_MODEL = 'login.User'
+
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=10),
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "AUTH_HEADER_TYPES": ("Bearer",),
+    # checks login.revocation on every request instead of the token_blacklist app
+    "AUTH_TOKEN_CLASSES": ("login.tokens.RevocableAccessToken",),
+}
+
+TOKEN_REVOCATION_CAPACITY = 100_000
+TOKEN_REVOCATION_ERROR_RATE = 0.001
+
+# Outgoing mail is queued in login.QueuedEmail and sent by `manage.py send_queued_emails`
+EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = env('EMAIL_HOST', default='localhost')
+EMAIL_PORT = env('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = env('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='no-reply@localhost')
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+EMAIL_QUEUE_RETRY_BASE_SECONDS = 30
+
+# One time passcodes live in the cache with a database fallback, see login/otp.py
+OTP_LENGTH = 4
+OTP_TTL = timedelta(minutes=10)
+OTP_MAX_ATTEMPTS = 5
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_URL = 'static/'
+
+# uploaded import files, see api.ImportJob
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# budgets checked by `manage.py startup_benchmark`
+STARTUP_BUDGET_SECONDS = 1.5
+MIDDLEWARE_BUDGET_MS = 2.0
+STARTUP_FORBIDDEN_MODULES = ['debug_toolbar', 'environ', 'fitz']
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
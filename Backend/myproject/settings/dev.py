@@ -0,0 +1,19 @@
+# Local development: reads Backend/.env and adds the debug toolbar.
+from pathlib import Path
+
+import environ
+
+environ.Env.read_env(Path(__file__).resolve().parent.parent.parent / '.env')
+
+from .base import *  # noqa: E402,F401,F403
+from .base import env  # noqa: E402
+
+DEBUG = env('DEBUG',default=True,cast=bool)
+
+INSTALLED_APPS += ['debug_toolbar']
+
+MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
+
+INTERNAL_IPS=[
+    '127.0.0.1'
+]
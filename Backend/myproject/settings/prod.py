@@ -0,0 +1,21 @@
+# Production: configuration comes from the process environment only, no .env parsing
+# and no debug-only apps or middleware. Check with `manage.py check --deploy`.
+from .base import *  # noqa: F401,F403
+from .base import env
+
+DEBUG = False
+
+ALLOWED_HOSTS = env('ALLOWED_HOSTS',cast=list)
+
+# throttle buckets, read-through cache locks and profiles have to be shared by every worker,
+# the default per-process LocMemCache would give each worker its own
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env('REDIS_URL'),
+    }
+}
+
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = env('SECURE_COOKIES',default=True,cast=bool)
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
@@ -0,0 +1,17 @@
+# Development with candidates split over one SQLite file per province, see api/sharding.py.
+# Create the shard files with `manage.py migrate --database=<alias>` for each alias.
+from .dev import *  # noqa: F401,F403
+from .dev import BASE_DIR, DATABASES
+
+PROVINCES = ['koshi', 'madhesh', 'bagmati', 'gandaki', 'lumbini', 'karnali', 'sudur paschimanchal']
+
+SHARD_DIR = BASE_DIR / 'shards'
+SHARD_DIR.mkdir(exist_ok=True)
+
+CANDIDATE_SHARDS = {name: f'province_{number}' for number, name in enumerate(PROVINCES, start=1)}
+
+DATABASES = {
+    **DATABASES,
+    **{alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': SHARD_DIR / f'{alias}.sqlite3'}
+       for alias in CANDIDATE_SHARDS.values()},
+}
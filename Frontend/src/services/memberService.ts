@@ -69,9 +69,11 @@ export const getMunicipalitiesByDistrict = async (districtId: number): Promise<M
 // Ward Members
 export const getWardMembers = async (params?: SearchParams): Promise<WardMembersResponse> => {
   try {
-    const queryString = params 
-      ? `?${new URLSearchParams(params as Record<string, string>).toString()}`
-      : '';
+    // bio is left out of candidate lists unless asked for
+    const queryString = `?${new URLSearchParams({
+      ...(params as Record<string, string>),
+      fields: 'name,gender,post,email,bio',
+    }).toString()}`;
     const response = await apiClient.get(`/candidate/${queryString}`);
     return response.data;
   } catch (error) {